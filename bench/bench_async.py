@@ -0,0 +1,56 @@
+"""concurrent async requests: one executor call per request vs the micro-batching coalescer
+
+    python -m bench.bench_async [--clients 64] [--requests 20] [--max-delay 0.005]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.corpus import load_reference
+from corefiob import HeuristicParser
+from corefiob.coalescer import RequestCoalescer
+
+
+async def client(call, sentences, n, latencies):
+    for i in range(n):
+        t = time.perf_counter()
+        await call(sentences[i % len(sentences)])
+        latencies.append(time.perf_counter() - t)
+
+
+async def run(call, sentences, clients, requests):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(call, sentences, requests, latencies)
+                           for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"req_per_sec": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-delay", type=float, default=0.005)
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+    sentences = [s for s, _ in load_reference()]
+    solver = HeuristicParser(slim=True)
+    solver.replace_corefs(sentences[0])  # load the model outside the timings
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def unbatched(sentence):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, solver.replace_corefs, sentence)
+
+    solver.coalescer = RequestCoalescer(solver, args.max_delay, args.max_batch)
+    for name, call in [("per-request", unbatched), ("coalesced", solver.replace_corefs_async)]:
+        res = asyncio.run(run(call, sentences, args.clients, args.requests))
+        print(f"{name:<12} {res['req_per_sec']:8.0f} req/s  "
+              f"p50 {res['p50_ms']:7.2f}ms  p99 {res['p99_ms']:7.2f}ms")
+    print("coalescer", solver.coalescer.stats)
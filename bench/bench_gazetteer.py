@@ -0,0 +1,60 @@
+"""gazetteer phrase matching cost against the number of phrases
+
+random 1-4 word phrases are added to a TokenTrie, matching time per token
+over the test corpus sentences should stay flat as the gazetteer grows
+
+    python -m bench.bench_gazetteer [--sizes 10 1000 100000] [--json]
+"""
+import argparse
+import json
+import random
+import time
+
+from bench.corpus import load_reference
+from corefiob import lexicon as lex
+from corefiob.gazetteer import TokenTrie
+
+
+def build_trie(size, vocab, seed=0):
+    rng = random.Random(seed)
+    trie = TokenTrie()
+    while len(trie) < size:
+        trie.add(" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 4))), lex.INANIMATE)
+    return trie
+
+
+def bench_size(size, sentences, vocab, repeat=20):
+    start = time.perf_counter()
+    trie = build_trie(size, vocab)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    matches = 0
+    for _ in range(repeat):
+        for tokens in sentences:
+            matches += len(trie.match(tokens))
+    elapsed = time.perf_counter() - start
+    n_tokens = sum(map(len, sentences)) * repeat
+    return {"phrases": size,
+            "build_ms": build * 1000,
+            "ns_per_token": elapsed / n_tokens * 1e9,
+            "matches_per_sentence": matches / (len(sentences) * repeat)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 1000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    sentences = [[t for t, _, _ in expected] for _, expected in load_reference()]
+    # phrases made of corpus words, so the walks actually go deep
+    vocab = sorted({t.lower() for tokens in sentences for t in tokens} |
+                   {f"device{i}" for i in range(1000)})
+    results = [bench_size(size, sentences, vocab, args.repeat) for size in args.sizes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['phrases']:>8} phrases  built in {r['build_ms']:8.1f}ms  "
+                  f"{r['ns_per_token']:7.0f}ns/token  "
+                  f"{r['matches_per_sentence']:5.2f} matches/sentence")
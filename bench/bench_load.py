@@ -0,0 +1,49 @@
+"""measure import time, first call latency and RSS for full vs slim spaCy pipelines
+
+each mode runs in a fresh interpreter so nothing is shared between measurements
+
+    python -m bench.bench_load [--model en_core_web_sm]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+SNIPPET = """
+import json, resource, time
+t0 = time.perf_counter()
+from corefiob import HeuristicParser
+t1 = time.perf_counter()
+parser = HeuristicParser(model={model!r}, slim={slim!r})
+parser.replace_corefs("Turn on the lights and make them blue")
+t2 = time.perf_counter()
+parser.replace_corefs("The girl said she would take the trash out")
+t3 = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000,
+    "first_call_ms": (t2 - t1) * 1000,
+    "warm_call_ms": (t3 - t2) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "pipes": parser.nlp.pipe_names
+}}))
+"""
+
+
+def run(model, slim):
+    out = subprocess.run([sys.executable, "-c", SNIPPET.format(model=model, slim=slim)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="en_core_web_sm")
+    args = parser.parse_args()
+    for slim in (False, True):
+        res = run(args.model, slim)
+        print(f"{'slim' if slim else 'full':<5} "
+              f"import={res['import_ms']:.1f}ms "
+              f"first_call={res['first_call_ms']:.1f}ms "
+              f"warm_call={res['warm_call_ms']:.2f}ms "
+              f"rss={res['max_rss_mb']:.1f}MB "
+              f"pipes={res['pipes']}")
@@ -0,0 +1,65 @@
+"""tagging pre-tokenized input: spaCy Doc(words=...) vs the old nltk fallback
+
+token lists used to go through nltk.pos_tag, which loads a new perceptron
+tagger on every call, they now run the spaCy tagging components on a Doc
+built from the tokens, or a persistent tagger with tagger="nltk"
+agreement is measured against the en_core_web_sm tags stored in the test suite
+
+    python -m bench.bench_pretokenized [--repeat 20] [--json]
+"""
+import argparse
+import json
+import time
+
+from bench.corpus import load_reference
+from corefiob.taggers import get_tagger, NLTK_TO_UPOS
+
+
+def nltk_fallback(tokens):
+    # what SpacyTagger.tag_tokens used to do
+    from nltk import pos_tag
+    return [(t, NLTK_TO_UPOS.get(p, p)) for t, p in pos_tag(tokens, tagset="universal")]
+
+
+def bench_path(name, tag, reference, repeat=20):
+    sentences = [[t for t, _, _ in expected] for _, expected in reference]
+    tag(sentences[0])  # load models outside the timed loop
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tagged = [tag(tokens) for tokens in sentences]
+    elapsed = time.perf_counter() - start
+    agree = total = 0
+    for postagged, (_, expected) in zip(tagged, reference):
+        total += len(expected)
+        agree += sum(p == e[1] for (_, p), e in zip(postagged, expected))
+    return {"path": name,
+            "sentences_per_sec": len(sentences) * repeat / elapsed,
+            "pos_agreement": agree / total}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    reference = load_reference()
+    paths = [("nltk.pos_tag", lambda: nltk_fallback),
+             ("spacy Doc", lambda: get_tagger("spacy").tag_tokens),
+             ("nltk persistent", lambda: get_tagger("nltk").tag_tokens)]
+    results = []
+    for name, make in paths:
+        try:
+            results.append(bench_path(name, make(), reference, args.repeat))
+        except (ImportError, LookupError, OSError) as e:
+            # nltk errors come wrapped in a banner of asterisks
+            msg = next((l.strip() for l in str(e).splitlines() if any(c.isalpha() for c in l)), "")
+            results.append({"path": name, "error": msg})
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "error" in r:
+                print(f"{r['path']:<16} unavailable: {r['error']}")
+            else:
+                print(f"{r['path']:<16} {r['sentences_per_sec']:10.0f} sent/s  "
+                      f"pos agreement {r['pos_agreement']:6.1%}")
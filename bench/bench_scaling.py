@@ -0,0 +1,52 @@
+"""check that HeuristicParser.iob_tag scales linearly with input length
+
+runs on synthetic pre-tagged documents, spacy is never called
+
+    python -m bench.bench_scaling [--sizes 1000 2000 4000 8000 16000] [--engine rules]
+"""
+import argparse
+import time
+
+from corefiob import HeuristicParser
+from corefiob.rules import RuleParser
+
+ENGINES = {"heuristic": HeuristicParser, "rules": RuleParser}
+
+# pronoun heavy template, repeated to the requested number of tokens
+TEMPLATE = [("The", "DET"), ("girl", "NOUN"), ("said", "VERB"), ("she", "PRON"),
+            ("would", "AUX"), ("take", "VERB"), ("the", "DET"), ("trash", "NOUN"),
+            ("out", "ADP"), (".", "PUNCT"),
+            ("Turn", "VERB"), ("on", "ADP"), ("the", "DET"), ("lights", "NOUN"),
+            ("and", "CCONJ"), ("make", "VERB"), ("them", "PRON"), ("blue", "ADJ"),
+            (".", "PUNCT"),
+            ("Bob", "PROPN"), ("said", "VERB"), ("he", "PRON"), ("likes", "VERB"),
+            ("it", "PRON"), (".", "PUNCT")]
+
+
+def make_doc(n_tokens):
+    return [TEMPLATE[i % len(TEMPLATE)] for i in range(n_tokens)]
+
+
+def bench(parser, n_tokens, repeat=3):
+    doc = make_doc(n_tokens)
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        parser.iob_tag(doc)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000, 16000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="heuristic")
+    args = parser.parse_args()
+    solver = ENGINES[args.engine]()
+    prev = None
+    for n in args.sizes:
+        t = bench(solver, n, args.repeat)
+        growth = f"x{t / prev:.2f}" if prev else ""
+        print(f"{n:>8} tokens  {t * 1000:10.2f}ms  {t / n * 1e6:8.2f}us/token  {growth}")
+        prev = t
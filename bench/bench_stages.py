@@ -0,0 +1,196 @@
+"""time every stage of HeuristicParser on the test sentences and long synthetic documents
+
+reports time per sentence/document, tokens/sec and the tracemalloc peak of each
+stage, iob_tag end to end and each columnar pass it runs, spacy is only called with --spacy (tokenize, pos_tag and end to end
+replace_corefs), otherwise the reference POS tags from the test suite are used
+
+    python -m bench.bench_stages [--spacy] [--json out.json]
+    python -m bench.bench_stages --save baseline.json
+    python -m bench.bench_stages --compare baseline.json [--threshold 0.1]
+
+--compare exits with status 1 if any stage got slower than the threshold
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from bench.bench_scaling import make_doc
+from bench.corpus import load_reference
+from corefiob import HeuristicParser
+from corefiob import columnar as col
+
+
+def iob_stages(parser):
+    # the passes of RuleParser._iob_tag, the ones HeuristicParser.iob_tag
+    # runs, each advances a state dict
+    parser = parser._columnar
+
+    def encode(s):
+        s["postagged"], s["pbits"], s["cols"] = parser._encode_pairs(s["postagged"])
+        s["tags"] = [col.O] * len(s["pbits"])
+
+    def forward_pass(s):
+        s["ents"], s["prons"] = parser._forward_pass(s["pbits"], s["cols"], s["tags"],
+                                                     s["postagged"])
+
+    def corefs_after(s):
+        s["corefs_after"] = parser._corefs_after(s["tags"], s["prons"])
+
+    def resolve_entities(s):
+        parser._resolve_entities(s["pbits"], s["cols"], s["tags"], s["ents"],
+                                 s["corefs_after"])
+
+    def fixup_pass(s):
+        s["iob"] = parser._fixup_pass(s["postagged"], s["pbits"], s["tags"])
+
+    return [encode, forward_pass, corefs_after, resolve_entities, fixup_pass]
+
+
+def _copy(state):
+    # stages edit their inputs in place, every run gets fresh ones, the
+    # encoded columns are tuples and never edited
+    return {k: v if isinstance(v, tuple) else v.copy() for k, v in state.items()}
+
+
+def load_corpora(doc_sizes):
+    sentences = [(text, [(tok, pos) for tok, pos, _ in iob])
+                 for text, iob in load_reference()]
+    docs = []
+    for n in doc_sizes:
+        postagged = make_doc(n)
+        docs.append((" ".join(tok for tok, _ in postagged), postagged))
+    return {"sentences": sentences, "long_docs": docs}
+
+
+def build_cases(parser, items, spacy):
+    # (stage name, [(input, n_tokens)], call, prepare) for one corpus, prepare
+    # runs outside the timings and turns an input into the call argument
+    cases = []
+    if spacy:
+        texts = [(text, len(postagged)) for text, postagged in items]
+        cases.append(("tokenize", texts, parser.tokenize, None))
+        cases.append(("pos_tag", texts, parser.pos_tag, None))
+
+    tagged = [(postagged, len(postagged)) for _, postagged in items]
+    cases.append(("iob_tag", tagged, parser.iob_tag, None))
+
+    states = [({"postagged": list(postagged)}, len(postagged)) for _, postagged in items]
+    for stage in iob_stages(parser):
+        cases.append(("iob_tag." + stage.__name__, [(_copy(s), n) for s, n in states],
+                      stage, _copy))
+        for state, _ in states:
+            stage(state)
+
+    resolved = [((text, state["iob"]), len(postagged))
+                for (text, postagged), (state, _) in zip(items, states)]
+    cases.append(("resolve", resolved, lambda args: parser._render(*args), None))
+    if spacy:
+        cases.append(("replace_corefs", texts, parser.replace_corefs, None))
+    return cases
+
+
+def measure(inputs, call, repeat, prepare=None):
+    # best of `repeat` passes over the corpus, then one pass under tracemalloc
+    best = float("inf")
+    for _ in range(repeat):
+        elapsed = 0.0
+        for args, _ in inputs:
+            if prepare:
+                args = prepare(args)
+            t = time.perf_counter()
+            call(args)
+            elapsed += time.perf_counter() - t
+        best = min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        peak = 0
+        for args, _ in inputs:
+            if prepare:
+                args = prepare(args)
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            call(args)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    n_tokens = sum(n for _, n in inputs)
+    return {"items": len(inputs),
+            "tokens": n_tokens,
+            "us_per_item": best / len(inputs) * 1e6,
+            "tokens_per_sec": n_tokens / best if best else 0.0,
+            "peak_kb": peak / 1024}
+
+
+def run(spacy=False, doc_sizes=(1000, 10000), repeat=5):
+    parser = HeuristicParser()
+    corpora = load_corpora(doc_sizes)
+    if spacy:
+        parser.pos_tag(corpora["sentences"][0][0])  # load the model outside the timings
+    results = {}
+    for corpus, items in corpora.items():
+        for name, inputs, call, prepare in build_cases(parser, items, spacy):
+            results[f"{corpus}/{name}"] = measure(inputs, call, repeat, prepare)
+    return {"meta": {"python": platform.python_version(),
+                     "spacy": spacy,
+                     "doc_sizes": list(doc_sizes),
+                     "repeat": repeat},
+            "results": results}
+
+
+def compare(current, baseline, threshold=0.1):
+    # (key, baseline us, current us, ratio, regressed) for stages in both runs
+    rows = []
+    for key, res in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or not old["us_per_item"]:
+            continue
+        ratio = res["us_per_item"] / old["us_per_item"]
+        rows.append((key, old["us_per_item"], res["us_per_item"], ratio,
+                     ratio > 1 + threshold))
+    return rows
+
+
+def print_report(report):
+    for key, res in report["results"].items():
+        print(f"{key:<45} {res['us_per_item']:12.2f}us/item "
+              f"{res['tokens_per_sec']:14.0f} tokens/s {res['peak_kb']:10.1f}KB peak")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spacy", action="store_true",
+                        help="include tokenize, pos_tag and end to end replace_corefs")
+    parser.add_argument("--doc-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file, - for stdout")
+    parser.add_argument("--save", help="save the results as a baseline")
+    parser.add_argument("--compare", help="baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed slowdown before a stage counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.spacy, args.doc_sizes, args.repeat)
+    for path in (args.json, args.save):
+        if path == "-":
+            print(json.dumps(report, indent=2))
+        elif path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+    if args.json != "-":
+        print_report(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print()
+        for key, old, new, ratio, regressed in compare(report, baseline, args.threshold):
+            regressions += regressed
+            print(f"{key:<45} {old:12.2f}us -> {new:12.2f}us  x{ratio:.2f}"
+                  f"{'  REGRESSION' if regressed else ''}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,63 @@
+"""compare POS tagger backends: speed and agreement with spaCy on the test corpus
+
+agreement is measured against the en_core_web_sm tags stored in the test suite,
+"iob stable" counts sentences whose iob_tag output is unchanged
+
+    python -m bench.bench_taggers [--taggers spacy nltk lexicon] [--json]
+"""
+import argparse
+import json
+import time
+
+from bench.corpus import load_reference
+from corefiob import HeuristicParser
+
+
+def bench_tagger(name, reference, repeat=20):
+    parser = HeuristicParser(tagger=name)
+    sentences = [s for s, _ in reference]
+    parser.tagger.tag(sentences[0])  # load models outside the timed loop
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tagged = [parser.tagger.tag(s) for s in sentences]
+    elapsed = time.perf_counter() - start
+
+    agree = total = stable = 0
+    for postagged, (_, expected) in zip(tagged, reference):
+        total += len(expected)
+        if [t for t, _ in postagged] == [t for t, _, _ in expected]:
+            agree += sum(p == e[1] for (_, p), e in zip(postagged, expected))
+        if parser.iob_tag(postagged) == expected:
+            stable += 1
+    return {"tagger": name,
+            "sentences_per_sec": len(sentences) * repeat / elapsed,
+            "pos_agreement": agree / total,
+            "iob_stable": stable / len(reference)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--taggers", nargs="+", default=["spacy", "nltk", "lexicon"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    reference = load_reference()
+    results = []
+    for name in args.taggers:
+        try:
+            results.append(bench_tagger(name, reference, args.repeat))
+        except (ImportError, LookupError, OSError) as e:
+            # nltk errors come wrapped in a banner of asterisks
+            msg = next((l.strip() for l in str(e).splitlines() if any(c.isalpha() for c in l)), "")
+            results.append({"tagger": name, "error": msg})
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "error" in r:
+                print(f"{r['tagger']:<8} unavailable: {r['error']}")
+            else:
+                print(f"{r['tagger']:<8} {r['sentences_per_sec']:10.0f} sent/s  "
+                      f"pos agreement {r['pos_agreement']:6.1%}  "
+                      f"iob stable {r['iob_stable']:6.1%}")
@@ -0,0 +1,22 @@
+import ast
+import os
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "test", "test_coref.py")
+
+
+def load_reference(path=TEST_FILE):
+    # (sentence, expected iob) pairs from the iob_tag assertions of the test suite
+    # the POS tags in there are en_core_web_sm output, so they double as a
+    # spaCy reference without loading the model
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    pairs = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or getattr(node.func, "attr", "") != "assertEqual":
+            continue
+        call, expected = node.args[:2]
+        if isinstance(call, ast.Call) and getattr(call.func, "attr", "") == "iob_tag" and \
+                call.args and isinstance(call.args[0], ast.Constant):
+            pairs.append((call.args[0].value, [tuple(t) for t in ast.literal_eval(expected)]))
+    return pairs
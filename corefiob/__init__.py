@@ -1,11 +1,52 @@
-from nltk import pos_tag
-import spacy
 import enum
+import json
+import os
+import sys
+from collections import deque
 from corefiob.lang import *
-from spacy.tokens.doc import Doc
+from corefiob import lexicon as lex
+from corefiob.result import CorefResult
+from corefiob.taggers import get_tagger
 
-# TODO this is WIP! postagger will be configurable as it is the most important piece of this pipeline
-nlp = spacy.load("en_core_web_sm")
+# pos_tag only reads token.pos_, which en_core_web_sm derives from
+# tok2vec + tagger + attribute_ruler, everything else is dead weight
+SLIM_EXCLUDE = ["parser", "ner", "lemmatizer", "senter"]
+
+
+def load_nlp(model="en_core_web_sm", slim=False):
+    # loaded lazily and shared by every parser using the same model,
+    # see corefiob.registry for the memory budget and load stats
+    from corefiob.registry import REGISTRY
+    return REGISTRY.load(model, slim)
+
+
+def get_model_version(model):
+    # read without importing spacy, so cache lookups stay cheap on cold workers
+    meta = os.path.join(str(model), "meta.json")
+    if os.path.isfile(meta):
+        with open(meta, encoding="utf-8") as f:
+            return json.load(f).get("version", "")
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version(model)
+    except (PackageNotFoundError, ValueError):
+        return ""
+
+
+def _is_doc(obj):
+    # do not import spacy just to answer an isinstance check
+    spacy = sys.modules.get("spacy")
+    if spacy is None:
+        return False
+    from spacy.tokens import Doc
+    return isinstance(obj, Doc)
+
+
+def __getattr__(name):
+    # corefiob.nlp used to be loaded at import time, keep it working
+    if name == "nlp":
+        return load_nlp(SPACY_MODELS["en"])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # different langs may use different subsets only
@@ -37,427 +78,469 @@ class CorefIOB(str, enum.Enum):
     ENTITY_INANIMATE_I = "I-ENTITY-INANIMATE"
 
 
+# pronoun class of every coref tag, the lexicon class a later pronoun of
+# that tag matches, see corefiob.columnar.COREF_BITS
+COREF_CLASSES = {
+    CorefIOB.COREF_MALE: lex.MALE_COREF,
+    CorefIOB.COREF_PLURAL_MALE: lex.MALE_COREF,
+    CorefIOB.COREF_FEMALE: lex.FEMALE_COREF,
+    CorefIOB.COREF_PLURAL_FEMALE: lex.FEMALE_COREF,
+    CorefIOB.COREF_NEUTRAL: lex.NEUTRAL_COREF,
+    CorefIOB.COREF_INANIMATE: lex.INANIMATE_COREF,
+    CorefIOB.COREF_PLURAL: lex.PLURAL_COREF
+}
+
+# antecedent kind of every entity tag, the keys of the streaming/session
+# antecedent state
+ENTITY_KINDS = {
+    CorefIOB.ENTITY_FEMALE: "female", CorefIOB.ENTITY_FEMALE_I: "female",
+    CorefIOB.ENTITY_MALE: "male", CorefIOB.ENTITY_MALE_I: "male",
+    CorefIOB.ENTITY_NEUTRAL: "neutral", CorefIOB.ENTITY_NEUTRAL_I: "neutral",
+    CorefIOB.ENTITY_INANIMATE: "inanimate", CorefIOB.ENTITY_INANIMATE_I: "inanimate",
+    CorefIOB.ENTITY_PLURAL: "plural", CorefIOB.ENTITY_PLURAL_I: "plural"
+}
+
+
+# antecedent kinds a pronoun tag can refer to, the closest entity wins
+# "they" is only tagged neutral in a text without plural entities, a plural
+# one carried from an earlier chunk or turn still counts
+COREF_KINDS = {
+    CorefIOB.COREF_FEMALE: ("female",),
+    CorefIOB.COREF_MALE: ("male",),
+    CorefIOB.COREF_NEUTRAL: ("neutral", "plural"),
+    CorefIOB.COREF_INANIMATE: ("inanimate",),
+    CorefIOB.COREF_PLURAL: ("plural",)
+}
+
+
+def _closest_antecedent(tag, last):
+    # last is kind -> (end token index, antecedent) of the entities seen so
+    # far, returns the antecedent of the pronoun tag or None
+    best = None
+    for kind in COREF_KINDS.get(tag, ()):
+        seen = last.get(kind)
+        if seen is not None and seen[1] and (best is None or seen[0] > best[0]):
+            best = seen
+    return None if best is None else best[1]
+
+
+def _move_to_end(antecedents, last):
+    # antecedents is kept in the order its kinds were last mentioned, the
+    # order _resolve_iob tells carried antecedents apart by
+    for kind, (_, text) in sorted(last.items(), key=lambda item: item[1][0]):
+        antecedents.pop(kind, None)
+        antecedents[kind] = text
+
+
+# entity kind -> (B-, I-) tags of gazetteer phrases, see corefiob.gazetteer
+PHRASE_TAGS = {
+    "FEMALE": (CorefIOB.ENTITY_FEMALE, CorefIOB.ENTITY_FEMALE_I),
+    "MALE": (CorefIOB.ENTITY_MALE, CorefIOB.ENTITY_MALE_I),
+    "INANIMATE": (CorefIOB.ENTITY_INANIMATE, CorefIOB.ENTITY_INANIMATE_I),
+    "NEUTRAL": (CorefIOB.ENTITY_NEUTRAL, CorefIOB.ENTITY_NEUTRAL_I)
+}
+
+
 class DummyParser:
+    def __init__(self, lang="en", model=None, slim=False, cache=None, tagger="spacy"):
+        self.lang = lang
+        self.model = model or SPACY_MODELS.get(lang)
+        self.slim = slim
+        # optional corefiob.cache.LRUCache or SQLiteCache, may be shared between parsers
+        self.cache = cache
+        # name of a backend in corefiob.taggers.POS_TAGGERS, or a backend instance
+        if isinstance(tagger, str):
+            self.tagger_name = tagger
+            self._tagger = None
+        else:
+            self.tagger_name = getattr(tagger, "name", type(tagger).__name__)
+            self._tagger = tagger
+        self._model_version = None
+
+    @property
+    def tagger(self):
+        if self._tagger is None:
+            self._tagger = get_tagger(self.tagger_name, self.lang, self.model, self.slim)
+        return self._tagger
+
+    @property
+    def nlp(self):
+        return load_nlp(self.model, self.slim)
+
     def tokenize(self, sentence):
         if isinstance(sentence, str):
-            sentence = nlp(sentence)
-        if isinstance(sentence, Doc):
+            return self.tagger.tokenize(sentence)
+        if _is_doc(sentence):
             return [token.text for token in sentence]
 
+    @property
+    def model_version(self):
+        if self._model_version is None:
+            self._model_version = get_model_version(self.model)
+        return self._model_version
+
+    def _cache_key(self, kind, text):
+        return kind, self.lang, self.tagger_name, self.model, self.model_version, text
+
+    def _cached(self, kind, text, compute):
+        # only raw strings are cached, lists are stored as tuples so the
+        # cached value can not be mutated and every caller gets a fresh copy
+        if self.cache is None or not isinstance(text, str):
+            return compute(text)
+        key = self._cache_key(kind, text)
+        value = self.cache.get(key)
+        if value is None:
+            value = compute(text)
+            if isinstance(value, list):
+                value = tuple(value)
+            self.cache.put(key, value)
+        return list(value) if isinstance(value, tuple) else value
+
     def pos_tag(self, tokens):
+        return self._cached("pos", tokens, self._pos_tag)
+
+    def _pos_tag(self, tokens):
         if isinstance(tokens, str):
-            tokens = nlp(tokens)
-        if isinstance(tokens, Doc):
+            return self.tagger.tag(tokens)
+        if _is_doc(tokens):
             return [(token.text, token.pos_) for token in tokens]
-        return pos_tag(tokens, tagset="universal")
+        return self.tagger.tag_tokens(tokens)
+
+    def pos_tag_many(self, sentences, batch_size=64, n_process=1):
+        return self.tagger.tag_many(sentences, batch_size=batch_size, n_process=n_process)
 
     def iob_tag(self, postagged_toks):
+        return self._cached("iob", postagged_toks, self._iob_tag)
+
+    def _iob_tag(self, postagged_toks):
         if isinstance(postagged_toks, str):
             postagged_toks = self.pos_tag(postagged_toks)
         iob = [(token, tag, "O") for (token, tag) in postagged_toks]
         return iob
 
+    def iob_tag_many(self, sentences, batch_size=64, n_process=1):
+        # lazily yields results in input order
+        for postagged_toks in self.pos_tag_many(sentences, batch_size, n_process):
+            yield self.iob_tag(postagged_toks)
 
-class HeuristicParser(DummyParser):
-    def __init__(self, lang="en"):
-        self.lang = lang
-        self.JOINER_TOKENS = JOINER_TOKENS.get(self.lang, [])
-        self.PREV_TOKENS = PREV_TOKENS.get(self.lang, [])
-        self.MALE_TOKENS = MALE_TOKENS.get(self.lang, [])
-        self.FEMALE_TOKENS = FEMALE_TOKENS.get(self.lang, [])
-        self.INANIMATE_TOKENS = INANIMATE_TOKENS.get(self.lang, [])
-        self.NEUTRAL_COREF_TOKENS = NEUTRAL_COREF_TOKENS.get(self.lang, [])
-        self.MALE_COREF_TOKENS = MALE_COREF_TOKENS.get(self.lang, [])
-        self.FEMALE_COREF_TOKENS = FEMALE_COREF_TOKENS.get(self.lang, [])
-        self.INANIMATE_COREF_TOKENS = INANIMATE_COREF_TOKENS.get(self.lang, [])
-        self.HUMAN_TOKENS = HUMAN_TOKENS.get(self.lang, [])
-
-    def _tag_entities(self, iob):
-        ents = {}
-
-        valid_helper_tags = ["ADJ", "DET", "NUM"]
-        valid_noun_tags = ["NOUN", "PROPN"]
-        valid_tags = valid_noun_tags + valid_helper_tags + ["ADP"]
-
-        for idx, (token, ptag, tag) in enumerate(iob):
-            # the last token can never be a valid coreference entity
-            if idx == len(iob) - 1:
-                break
-            is_plural = token.endswith("s")
-            clean_token = token.lower().rstrip("s ")
-
-            prev = iob[idx - 1] if idx > 0 else ("", "", "")
-            prev2 = iob[idx - 2] if idx > 1 else ("", "", "")
-            nxt = iob[idx + 1] if idx + 1 < len(iob) else ("", "", "")
-            nxt2 = iob[idx + 2] if idx + 2 < len(iob) else ("", "", "")
-
-            is_noun = ptag in valid_noun_tags and prev[0] not in self.JOINER_TOKENS
-            # plurals of the format NOUN and NOUN
-            is_conjunction = token in self.JOINER_TOKENS and \
-                             prev[1] in valid_noun_tags and \
-                             nxt[1] in valid_noun_tags
-            # nouns of the form "NOUN of NOUN" or "NOUN of the ADJ NOUN"
-            is_adp = ptag == "ADP" and "ENTITY" in prev[2] and nxt[1] in valid_noun_tags
-
-            if is_adp:
-                newtag = prev[2].replace("B-", "I-")
-                iob[idx] = (token, ptag, newtag)
-                iob[idx + 1] = (nxt[0], nxt[1], newtag)
-                ents[idx] = ents[idx + 1] = newtag
-
-            elif is_conjunction:
-                iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_PLURAL)
-                iob[idx] = (token, ptag, CorefIOB.ENTITY_PLURAL_I)
-                iob[idx + 1] = (nxt[0], nxt[1], CorefIOB.ENTITY_PLURAL_I)
-
-                ents[idx - 1] = CorefIOB.ENTITY_PLURAL
-                ents[idx] = CorefIOB.ENTITY_PLURAL_I
-                ents[idx + 1] = CorefIOB.ENTITY_PLURAL_I
-            elif is_noun:
-                first = True
-                # join multi word nouns
-                if prev[1] == ptag:
-                    t = prev[2].replace("B-", "I-")
-                    iob[idx] = (token, ptag, t)
-                    ents[idx] = t
-                    continue
-
-                # include adjectives and determinants
-                if prev[1] in valid_helper_tags or \
-                        prev[0].lower() in self.PREV_TOKENS:
-                    first = False
-
-                # implicitly gendered words, eg sister/brother mother/father
-                if clean_token in self.FEMALE_TOKENS:
-                    if first:
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_FEMALE)
-                        ents[idx] = CorefIOB.ENTITY_FEMALE
-                    else:
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_FEMALE)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_FEMALE_I)
-                        ents[idx - 1] = CorefIOB.ENTITY_FEMALE
-                        ents[idx] = CorefIOB.ENTITY_FEMALE_I
-                elif clean_token in self.MALE_TOKENS:
-                    if first:
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_MALE)
-                        ents[idx] = CorefIOB.ENTITY_MALE
-                    else:
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_MALE)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_MALE_I)
-                        ents[idx - 1] = CorefIOB.ENTITY_MALE
-                        ents[idx] = CorefIOB.ENTITY_MALE_I
-
-                # known reference inanimate token, eg, iot device types "light"
-                elif clean_token in self.INANIMATE_TOKENS:
-                    if first:
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_INANIMATE)
-                        ents[idx] = CorefIOB.ENTITY_INANIMATE
-                    elif prev2[1] in valid_helper_tags:
-                        iob[idx - 2] = (prev2[0], prev2[1], CorefIOB.ENTITY_INANIMATE)
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_INANIMATE_I)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_INANIMATE_I)
-
-                        ents[idx - 2] = CorefIOB.ENTITY_INANIMATE
-                        ents[idx - 1] = CorefIOB.ENTITY_INANIMATE_I
-                        ents[idx] = CorefIOB.ENTITY_INANIMATE_I
-                    else:
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_INANIMATE)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_INANIMATE_I)
-
-                        ents[idx - 1] = CorefIOB.ENTITY_INANIMATE
-                        ents[idx] = CorefIOB.ENTITY_INANIMATE_I
-
-                # ends with "s" its a plural noun
-                elif is_plural:
-                    if first:
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_PLURAL)
-                        ents[idx] = CorefIOB.ENTITY_PLURAL
-                    else:
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_PLURAL)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_PLURAL_I)
-                        ents[idx - 1] = CorefIOB.ENTITY_PLURAL
-                        ents[idx] = CorefIOB.ENTITY_PLURAL_I
-
-                # if its a unknown noun, its a neutral entity
-                else:
-                    if first:
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_NEUTRAL)
-                        ents[idx] = CorefIOB.ENTITY_NEUTRAL
-                    elif prev2[1] in valid_helper_tags:
-                        iob[idx - 2] = (prev2[0], prev2[1], CorefIOB.ENTITY_NEUTRAL)
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_NEUTRAL_I)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_NEUTRAL_I)
-
-                        ents[idx - 2] = CorefIOB.ENTITY_NEUTRAL
-                        ents[idx - 1] = CorefIOB.ENTITY_NEUTRAL_I
-                        ents[idx] = CorefIOB.ENTITY_NEUTRAL_I
-                    else:
-                        iob[idx - 1] = (prev[0], prev[1], CorefIOB.ENTITY_NEUTRAL)
-                        iob[idx] = (token, ptag, CorefIOB.ENTITY_NEUTRAL_I)
-
-                        ents[idx - 1] = CorefIOB.ENTITY_NEUTRAL
-                        ents[idx] = CorefIOB.ENTITY_NEUTRAL_I
-
-                # handle sequential NOUN words
-                if nxt[1] in valid_tags and nxt2[1] in valid_tags:
-                    t = tag.replace("B-", "I-")
-                    iob[idx + 1] = (nxt[0], nxt[1], t)
-                    iob[idx + 2] = (nxt2[0], nxt2[1], t)
-                    ents[idx + 1] = ents[idx + 2] = t
-
-            elif ptag == "ADP" and prev[2] != "O":
-                # handle NOUN of the NOUN
-                if nxt[1] in valid_tags and nxt2[1] in valid_noun_tags:
-                    t = prev[2].replace("B-", "I-")
-                    iob[idx] = (token, ptag, t)
-                    iob[idx + 1] = (nxt[0], nxt[1], t)
-                    iob[idx + 2] = (nxt2[0], nxt2[1], t)
-                    ents[idx] = ents[idx + 1] = ents[idx + 2] = t
-
-        return iob, ents
-
-    def _tag_prons(self, iob, ents):
-        prons = {}
-        for idx, (token, tag, _) in enumerate(iob):
-            clean_token = token.lower().strip()
-            if clean_token in self.INANIMATE_COREF_TOKENS:
-                iob[idx] = (token, tag, CorefIOB.COREF_INANIMATE)
-                prons[idx] = CorefIOB.COREF_INANIMATE
-            elif clean_token in self.FEMALE_COREF_TOKENS:
-                iob[idx] = (token, tag, CorefIOB.COREF_FEMALE)
-                prons[idx] = CorefIOB.COREF_FEMALE
-            elif clean_token in self.MALE_COREF_TOKENS:
-                iob[idx] = (token, tag, CorefIOB.COREF_MALE)
-                prons[idx] = CorefIOB.COREF_MALE
-            elif clean_token in self.NEUTRAL_COREF_TOKENS:
-                has_plural = any(v == CorefIOB.ENTITY_PLURAL for e, v in ents.items())
-                if has_plural:
-                    iob[idx] = (token, tag, CorefIOB.COREF_PLURAL)
-                    prons[idx] = CorefIOB.COREF_PLURAL
-                else:
-                    iob[idx] = (token, tag, CorefIOB.COREF_NEUTRAL)
-                    prons[idx] = CorefIOB.COREF_NEUTRAL
-        return iob, prons
-
-    def _untag_bad_candidates(self, iob, ents, bad_ents):
-        # untag impossible entity corefs
-        for e in bad_ents:
-            if e in ents:
-                # print("  - impossible coref ", e)
-                ents.pop(e)
-            token, ptag, _ = iob[e]
-            iob[e] = (token, ptag, "O")
-        return iob, ents
-
-    def _disambiguate(self, iob, ents, prons):
-
-        valid_helper_tags = ["ADJ", "DET", "NUM"]
-        valid_noun_tags = ["NOUN", "PROPN"]
-        valid_tags = valid_noun_tags + valid_helper_tags + ["ADP"]
-
-        # untag entities that can not possibly corefer
-        # if there is no pronoun after the entity, then nothing can corefer to it
-        bad_ents = [idx for idx in ents.keys() if not any(i > idx for i in prons.keys())]
-
-        for ent, tag in ents.items():
-            if ent in bad_ents:
-                continue
-            possible_coref = {k: v for k, v in prons.items() if k > ent}
-            token, ptag, _ = iob[ent]
-            prevtoken, prevptag, prevtag = iob[ent - 1]
-            nxttoken, nxtptag, nxttag = iob[ent + 1] if ent + 1 < len(iob) else ("", "", "")
-            prev2 = iob[ent - 2] if ent > 1 else ("", "", "")
-            clean_token = token.lower().rstrip("s ")
-
-            neutral_corefs = any(t.endswith("NEUTRAL") for t in possible_coref.values())
-            inanimate_corefs = any(t.endswith("INANIMATE") for t in possible_coref.values())
-            female_corefs = {k: t for k, t in possible_coref.items() if t.endswith("-FEMALE")}
-            male_corefs = {k: t for k, t in possible_coref.items() if t.endswith("-MALE")}
-
-            # disambiguate neutral
-            if tag.endswith("ENTITY-NEUTRAL") and ptag in valid_noun_tags:
-                is_human = clean_token in self.HUMAN_TOKENS or ptag in ["PROPN"]
-
-                # disambiguate neutral/inanimate
-                if not neutral_corefs and inanimate_corefs and not is_human:
-                    if tag.startswith("I-") or prevtag in [tag, CorefIOB.ENTITY_INANIMATE,
-                                                           CorefIOB.ENTITY_INANIMATE_I]:
-                        tag = CorefIOB.ENTITY_INANIMATE_I
-                        if prev2[1] in valid_helper_tags:
-                            iob[ent - 2] = (prev2[0], prev2[1], CorefIOB.ENTITY_INANIMATE)
-                            iob[ent - 1] = (prevtoken, prevptag, CorefIOB.ENTITY_INANIMATE_I)
-                            ents[ent - 2] = CorefIOB.ENTITY_INANIMATE
-                            ents[ent - 1] = CorefIOB.ENTITY_INANIMATE_I
-                        else:
-                            iob[ent - 1] = (prevtoken, prevptag, CorefIOB.ENTITY_INANIMATE)
-                            ents[ent - 1] = CorefIOB.ENTITY_INANIMATE
-                        # print("  - replacing NEUTRAL -> INANIMATE ", iob[ent - 1])
-                    else:
-                        tag = CorefIOB.ENTITY_INANIMATE
-                    iob[ent] = (token, ptag, tag)
-                    ents[ent] = tag
-                    # print("  - replacing NEUTRAL -> INANIMATE ", iob[ent])
-
-                elif is_human:
-                    if male_corefs and not female_corefs:
-                        if tag.startswith("I-") or prevtag in [tag, CorefIOB.ENTITY_MALE, CorefIOB.ENTITY_MALE_I]:
-                            tag = CorefIOB.ENTITY_MALE_I
-                            if prevtag not in [CorefIOB.ENTITY_MALE, CorefIOB.ENTITY_MALE_I]:
-                                iob[ent - 1] = (prevtoken, prevptag, CorefIOB.ENTITY_MALE)
-                                ents[ent - 1] = CorefIOB.ENTITY_MALE
-                                # print("  - replacing NEUTRAL -> MALE ", iob[ent - 1])
-                        else:
-                            tag = CorefIOB.ENTITY_MALE
-                        iob[ent] = (token, ptag, tag)
-                        ents[ent] = tag
-                        # print("  - replacing NEUTRAL -> MALE ", iob[ent])
-                    elif female_corefs and not male_corefs:
-                        if tag.startswith("I-") or prevtag in [tag, CorefIOB.ENTITY_MALE, CorefIOB.ENTITY_MALE_I]:
-                            tag = CorefIOB.ENTITY_FEMALE_I
-                            iob[ent - 1] = (prevtoken, prevptag, CorefIOB.ENTITY_FEMALE)
-                            ents[ent - 1] = CorefIOB.ENTITY_FEMALE
-                            # print("  - replacing NEUTRAL -> FEMALE ", iob[ent - 1])
-                        else:
-                            tag = CorefIOB.ENTITY_FEMALE
-                        iob[ent] = (token, ptag, tag)
-                        ents[ent] = tag
-                        # print("  - replacing NEUTRAL -> FEMALE ", iob[ent])
-
-                if (prevptag in valid_noun_tags or prevptag in valid_helper_tags or prevptag == "ADP") and \
-                        (prev2[1] in valid_helper_tags or prev2[1] in valid_noun_tags):
-                    iob[ent - 1] = (prevtoken, prevptag, tag.replace("B-", "I-"))
-                    ents[ent - 1] = tag.replace("B-", "I-")
-                    iob[ent] = (token, ptag, tag.replace("B-", "I-"))
-                    ents[ent] = tag.replace("B-", "I-")
-
-        iob, ents = self._untag_bad_candidates(iob, ents, bad_ents)
-
-        return iob, ents, prons
-
-    def _fix_iob_seqs(self, iob):
-        valid_helper_tags = ["ADJ", "DET", "NUM", "ADP"]
-        for idx, (token, ptag, tag) in enumerate(iob):
-            if tag in ["O", CorefIOB.COREF_MALE, CorefIOB.COREF_FEMALE,
-                       CorefIOB.COREF_INANIMATE, CorefIOB.COREF_NEUTRAL,
-                       CorefIOB.COREF_PLURAL, CorefIOB.COREF_PLURAL_FEMALE, CorefIOB.COREF_PLURAL_MALE]:
-                continue
-
-            prev = iob[idx - 1] if idx > 0 else ("", "", "O")
-            prev2 = iob[idx - 2] if idx > 1 else ("", "", "O")
-            nxt = iob[idx + 1] if idx + 1 < len(iob) else ("", "", "O")
-            nxt2 = iob[idx + 2] if idx + 2 < len(iob) else ("", "", "O")
-
-            # fix sequential B-ENTITY B-ENTITY -> B-ENTITY I-ENTITY
-            if tag.startswith("B-"):
-                if prev[2][2:] == tag[2:]:
-                    iob[idx] = (token, ptag, tag.replace("B-", "I-"))
-
-            # fix trailing not-nouns
-            if ptag in valid_helper_tags:
-                if nxt[2] == "O":
-                    iob[idx] = (token, ptag, "O")
-        return iob
 
-    def _filter_coref_mismatches(self, iob, ents, prons):
-        # untag mismatched entities with coref gender
-        bad_ents = []
-        for ent, tag in ents.items():
-            possible_coref = {k: v for k, v in prons.items() if k > ent}
-            token, ptag, _ = iob[ent]
-            prevtoken, prevptag, _ = iob[ent - 1]
-            clean_token = token.lower().rstrip("s ")
-
-            neutral_corefs = any(t.endswith("NEUTRAL") for t in possible_coref.values())
-            inanimate_corefs = any(t.endswith("INANIMATE") for t in possible_coref.values())
-            plural_corefs = any(t.endswith("PLURAL") for t in possible_coref.values())
-
-            female_corefs = {k: t for k, t in possible_coref.items() if t.endswith("-FEMALE")}
-            male_corefs = {k: t for k, t in possible_coref.items() if t.endswith("-MALE")}
-
-            # untag plural entities if there are no plural corefs
-            if tag.endswith("ENTITY-PLURAL") and not plural_corefs:
-                # print("  - impossible plural ", ent)
-                bad_ents.append(ent)
-            # untag male entities if there are no male corefs
-            elif tag.endswith("ENTITY-MALE") and not male_corefs:
-                # print("  - impossible male ", ent)
-                bad_ents.append(ent)
-            # untag female entities if there are no female corefs
-            elif tag.endswith("ENTITY-FEMALE") and not female_corefs:
-                # print("  - impossible female ", ent)
-                bad_ents.append(ent)
-            # untag neutral entities
-            # if there are no neutral corefs AND there are inanimate corefs
-            elif tag.endswith("ENTITY-NEUTRAL") and \
-                    not neutral_corefs and \
-                    (inanimate_corefs or male_corefs or
-                     female_corefs or plural_corefs):
-                # print("  - impossible neutral ", ent)
-                bad_ents.append(ent)
-
-        iob, ents = self._untag_bad_candidates(iob, ents, bad_ents)
-        return iob, ents
+class HeuristicParser(DummyParser):
+    def __init__(self, lang="en", model=None, slim=False, cache=None, tagger="spacy",
+                 metrics=None, memo=None, gate=None):
+        super().__init__(lang, model, slim, cache, tagger)
+        # optional corefiob.metrics.ParserMetrics, stage timings and rule hits
+        self.metrics = metrics
+        # optional corefiob.cache.SignatureCache, tags by sentence signature
+        self.memo = memo
+        # optional corefiob.gate.PronounGate, skips text without pronouns
+        self.gate = gate
+        # one hashed token -> class bitmask lookup answers all the list checks
+        self.lexicon = lex.get_lexicon(self.lang)
+        self._coalescer = None
+        self._rule_parser = None
+
+    @property
+    def coalescer(self):
+        # batches concurrent *_async calls, replace it to tune the window
+        if self._coalescer is None:
+            from corefiob.coalescer import RequestCoalescer
+            self._coalescer = RequestCoalescer(self)
+        return self._coalescer
+
+    @coalescer.setter
+    def coalescer(self, coalescer):
+        self._coalescer = coalescer
+
+    def _cache_key(self, kind, text):
+        if kind == "pos":
+            return super()._cache_key(kind, text)
+        # tagging results depend on the lexicon contents too
+        return super()._cache_key(kind, text) + (self.lexicon.fingerprint,)
+
+    def _gated(self, sentence):
+        return self.gate is not None and isinstance(sentence, str) and \
+            not self.gate.may_resolve(sentence)
+
+    def _gated_iob(self, sentence):
+        # the all "O" result of a gated sentence, tokenized like the tagger
+        # would, the POS column comes from the lexicon tagger word lists
+        # instead of the model, so it may differ from the tags the sentence
+        # would get ungated, the IOB column never does
+        tagger = get_tagger("lexicon", self.lang)
+        return [(token, ptag, "O") for token, ptag in tagger.tag_tokens(self.tokenize(sentence))]
 
     def iob_tag(self, postagged_toks):
+        if self._gated(postagged_toks):
+            return self._gated_iob(postagged_toks)
+        if self.memo is None:
+            return super().iob_tag(postagged_toks)
+        return self._cached("iob", postagged_toks, self._memo_iob_tag)
+
+    def iob_tag_many(self, sentences, batch_size=64, n_process=1):
+        if self.gate is None:
+            yield from super().iob_tag_many(sentences, batch_size, n_process)
+            return
+        for text, postagged_toks in self._pos_tag_texts(sentences, batch_size, n_process,
+                                                        gate=True):
+            yield self._gated_iob(text) if postagged_toks is None else self.iob_tag(postagged_toks)
+
+    def _memo_iob_tag(self, postagged_toks):
         if isinstance(postagged_toks, str):
             postagged_toks = self.pos_tag(postagged_toks)
-        iob = [(token, tag, "O") for (token, tag) in postagged_toks]
+        return self.memo.iob_tag(self.lexicon, postagged_toks, self._iob_tag)
 
-        iob, ents = self._tag_entities(iob)
-        iob, prons = self._tag_prons(iob, ents)
-        iob, ents, prons = self._disambiguate(iob, ents, prons)
-        iob, ents = self._filter_coref_mismatches(iob, ents, prons)
-        iob = self._fix_iob_seqs(iob)
-        return iob
-
-    def replace_corefs(self, sentence):
+    def _iob_tag(self, postagged_toks):
+        if isinstance(postagged_toks, str):
+            postagged_toks = self.pos_tag(postagged_toks)
+        return self._columnar._iob_tag(postagged_toks)
+
+    @property
+    def _columnar(self):
+        # tagging runs the passes of corefiob.rules.RuleParser, driven by the
+        # lang.py rule tables over columnar int lists, metrics included time
+        # and count those passes
+        if self._rule_parser is None:
+            from corefiob.rules import RuleParser
+            self._rule_parser = RuleParser(self.lang, self.model, self.slim,
+                                           tagger=self._tagger or self.tagger_name,
+                                           metrics=self.metrics)
+        return self._rule_parser
+
+    def replace_corefs(self, sentence, return_edits=False):
+        # with return_edits a (text, edits) tuple is returned, edits is a list
+        # of (char_start, char_end, replacement) into the input string, or
+        # None if the tokens could not be mapped back onto it
+        if self._gated(sentence):
+            return (sentence, []) if return_edits else sentence
+        if return_edits:
+            return self._replace_corefs(sentence, return_edits=True)
+        return self._cached("replace", sentence, self._replace_corefs)
+
+    def _replace_corefs(self, sentence, return_edits=False):
         postagged_toks = self.pos_tag(sentence)
         iob = self.iob_tag(postagged_toks)
-
-        female = ""
-        male = ""
-        neutral = ""
-        plural = ""
-        inanimate = ""
+        return self._render(sentence, iob, return_edits=return_edits)
+
+    def resolve(self, sentence):
+        # tags once and returns a CorefResult with the tokens, tags, clusters
+        # and the resolved text, instead of calling iob_tag and replace_corefs
+        # takes the same input as iob_tag, plus a Doc or a list of tokens
+        if self._gated(sentence):
+            return CorefResult(self, sentence, self._gated_iob(sentence))
+        postagged_toks = sentence
+        if _is_doc(sentence) or all(isinstance(tok, str) for tok in sentence):
+            postagged_toks = self.pos_tag(sentence)
+        return CorefResult(self, sentence, self.iob_tag(postagged_toks))
+
+    def resolve_many(self, sentences, batch_size=64, n_process=1):
+        # lazily yields CorefResults in input order
+        for text, postagged_toks in self._pos_tag_texts(sentences, batch_size, n_process,
+                                                        gate=True):
+            iob = self._gated_iob(text) if postagged_toks is None else self.iob_tag(postagged_toks)
+            yield CorefResult(self, text, iob)
+
+    async def iob_tag_async(self, sentence):
+        return await self.coalescer.submit("iob", sentence)
+
+    async def replace_corefs_async(self, sentence):
+        return await self.coalescer.submit("replace", sentence)
+
+    def replace_corefs_many(self, sentences, batch_size=64, n_process=1):
+        # lazily yields results in input order
+        for text, postagged_toks in self._pos_tag_texts(sentences, batch_size, n_process,
+                                                        gate=True):
+            yield text if postagged_toks is None else self._render(text, self.iob_tag(postagged_toks))
+
+    def replace_corefs_stream(self, chunks, window=32, batch_size=64):
+        # resolves an iterator of sentences/chunks, yielding text chunk by chunk
+        # only the last antecedent of each kind and the last `window` tokens are
+        # carried over, so memory does not grow with document length, the window
+        # is tagged again with the next chunk, pronouns reach further back
+        # through the carried antecedents
+        antecedents = {}
+        context = []
+        for text, postagged_toks in self._pos_tag_texts(chunks, batch_size):
+            postagged_toks = context + postagged_toks
+            iob = self.iob_tag(postagged_toks)
+            yield self._render(text, iob, antecedents, start=len(context))
+            candidates = self._carry_antecedents(antecedents, iob, len(context))
+            context = []
+            if window > 0:
+                # the window never starts in the middle of an entity
+                tags = [tag for _, _, tag in iob[:len(iob) - len(candidates)] + candidates]
+                cut = max(len(postagged_toks) - window, 0)
+                while cut > 0 and tags[cut].startswith("I-"):
+                    cut -= 1
+                context = postagged_toks[cut:]
+
+    def _pos_tag_texts(self, sentences, batch_size=64, n_process=1, gate=False):
+        # pairs every input with its tags, nlp.pipe keeps the input order
+        # with gate, sentences self.gate rules out are paired with None and
+        # never reach the tagger
+        gate = gate and self.gate is not None
+        pending = deque()
+
+        def feed():
+            for sentence in sentences:
+                skip = gate and self._gated(sentence)
+                pending.append((sentence, skip))
+                if not skip:
+                    yield sentence
+
+        for postagged_toks in self.pos_tag_many(feed(), batch_size, n_process):
+            sentence, skip = pending.popleft()
+            while skip:
+                yield sentence, None
+                sentence, skip = pending.popleft()
+            yield sentence, postagged_toks
+        while pending:
+            yield pending.popleft()[0], None
+
+    def _render(self, sentence, iob, antecedents=None, start=0, return_edits=False):
+        # splice the antecedents into the original string so its spacing and
+        # punctuation survive, joining tokens is only a fallback for
+        # pre-tokenized input or tokenizers that rewrite the text
+        spans = None
+        if isinstance(sentence, str):
+            spans = self._token_spans(sentence, [tok for tok, _, _ in iob[start:]])
+        if spans is None:
+            text = self._join_tokens(self._resolve_iob(iob, antecedents, start))
+            return (text, None) if return_edits else text
+
+        replaced = {}
+        self._resolve_iob(iob, antecedents, start, replaced)
+        edits = []
+        chunks = []
+        last = 0
+        for idx in sorted(replaced):
+            char_start, char_end = spans[idx - start]
+            edits.append((char_start, char_end, replaced[idx]))
+            chunks.append(sentence[last:char_start])
+            chunks.append(replaced[idx])
+            last = char_end
+        chunks.append(sentence[last:])
+        text = "".join(chunks)
+        return (text, edits) if return_edits else text
+
+    @staticmethod
+    def _token_spans(text, tokens):
+        # spacy tokenization is non destructive, every token is found in order
+        spans = []
+        end = 0
+        for tok in tokens:
+            begin = text.find(tok, end)
+            if begin < 0:
+                return None
+            end = begin + len(tok)
+            spans.append((begin, end))
+        return spans
+
+    def _resolve_iob(self, iob, antecedents=None, start=0, replaced=None):
+        # antecedents is updated in place, only tokens from start on are returned
+        # replaced, if given, collects {token index: antecedent} substitutions
+        if antecedents is None:
+            antecedents = {}
+        # carried antecedents come before the text, the last mentioned closest
+        last = {kind: (pos - len(antecedents), text)
+                for pos, (kind, text) in enumerate(antecedents.items())}
 
         solved = []
         # simple heuristic, choose the closest matching entity and coref
         for idx, (tok, pos, tag) in enumerate(iob):
-            if tag == CorefIOB.ENTITY_FEMALE:
-                female = tok
-            elif tag == CorefIOB.ENTITY_FEMALE_I:
-                female = f"{female} {tok}"
-            elif tag == CorefIOB.ENTITY_MALE:
-                male = tok
-            elif tag == CorefIOB.ENTITY_MALE_I:
-                male = f"{male} {tok}"
-            elif tag == CorefIOB.ENTITY_NEUTRAL:
-                neutral = tok
-            elif tag == CorefIOB.ENTITY_NEUTRAL_I:
-                neutral = f"{neutral} {tok}"
-            elif tag == CorefIOB.ENTITY_INANIMATE:
-                inanimate = tok
-            elif tag == CorefIOB.ENTITY_INANIMATE_I:
-                inanimate = f"{inanimate} {tok}"
-            elif tag == CorefIOB.ENTITY_PLURAL:
-                plural = tok
-            elif tag == CorefIOB.ENTITY_PLURAL_I:
-                plural = f"{plural} {tok}"
-
-            if tag == CorefIOB.COREF_FEMALE and female:
-                solved.append(female)
-            elif tag == CorefIOB.COREF_MALE and male:
-                solved.append(male)
-            elif tag == CorefIOB.COREF_INANIMATE and inanimate:
-                solved.append(inanimate)
-            elif tag == CorefIOB.COREF_NEUTRAL and neutral:
-                solved.append(neutral)
-            elif tag == CorefIOB.COREF_PLURAL and plural:
-                solved.append(plural)
-            else:
-                solved.append(tok)
+            kind = ENTITY_KINDS.get(tag)
+            if kind is not None:
+                if tag.startswith("B-"):
+                    last[kind] = (idx, tok)
+                else:
+                    last[kind] = (idx, f"{last.get(kind, (idx, ''))[1]} {tok}")
 
-        # TODO do this properly with non destructive tokenization
+            if idx < start:
+                continue
+            antecedent = _closest_antecedent(tag, last)
+            if antecedent is None:
+                solved.append(tok)
+                continue
+            solved.append(antecedent)
+            if replaced is not None:
+                replaced[idx] = antecedent
+
+        _move_to_end(antecedents, {kind: seen for kind, seen in last.items()
+                                   if seen[0] >= 0 and seen[1]})
+        return solved
+
+    @staticmethod
+    def _entity_spans(iob, start=0):
+        # [(kind, token indexes)] of the entities from start on, an I- tag
+        # continues the last entity of its kind, as in _resolve_iob
+        spans = []
+        current = {}
+        for idx in range(start, len(iob)):
+            tag = iob[idx][2]
+            kind = ENTITY_KINDS.get(tag)
+            if kind is None:
+                continue
+            if tag.startswith("B-") or kind not in current:
+                current[kind] = [idx]
+                spans.append((kind, current[kind]))
+            else:
+                current[kind].append(idx)
+        return spans
+
+    def _carry_antecedents(self, antecedents, iob, start=0):
+        # keeps the last entity of every kind in iob[start:] for the next chunk
+        # or turn, call it once the text is rendered, returns the candidate tags
+        # an entity only keeps its tag when a matching pronoun follows in the
+        # same text, so the candidates are tagged again as if pronouns of every
+        # kind followed, a neutral one counts for the kinds the neutral entity
+        # rules turn it into once a pronoun shows up
+        candidates = self._columnar._candidate_iob([(tok, pos) for tok, pos, _ in iob[start:]])
+        last = {}
+        for kind, idxs in self._entity_spans(candidates):
+            kinds = [kind]
+            if kind == "neutral":
+                nouns = [(tok, pos) for tok, pos, _ in map(candidates.__getitem__, idxs)
+                         if pos in ("NOUN", "PROPN")]
+                if any(pos == "PROPN" or self.lexicon.get(tok.lower().rstrip("s ")) & lex.HUMAN
+                       for tok, pos in nouns):
+                    kinds += ["male", "female"]
+                elif nouns:
+                    kinds.append("inanimate")
+            for kind in kinds:
+                last[kind] = (start + idxs[-1], " ".join(candidates[i][0] for i in idxs))
+        # an entity the text itself resolved wins over a candidate ending with it
+        for kind, idxs in self._entity_spans(iob, start):
+            if idxs[-1] >= last.get(kind, (-1,))[0]:
+                last[kind] = (idxs[-1], " ".join(iob[i][0] for i in idxs))
+        _move_to_end(antecedents, last)
+        return candidates
+
+    @staticmethod
+    def _resolve_clusters(iob):
+        # same choices as _resolve_iob, by token index
+        # returns [(antecedent token indexes, pronoun token indexes)]
+        return HeuristicParser._tag_clusters([tag for _, _, tag in iob])
+
+    @staticmethod
+    def _tag_clusters(tags):
+        # _resolve_clusters for a list of tags, CorefIOB members or "O"
+        last = {}
+        clusters = {}
+        for idx, tag in enumerate(tags):
+            kind = ENTITY_KINDS.get(tag)
+            if kind is not None:
+                if tag.startswith("B-"):
+                    last[kind] = (idx, (idx,))
+                else:
+                    last[kind] = (idx, last.get(kind, (idx, ()))[1] + (idx,))
+                continue
+            span = _closest_antecedent(tag, last)
+            if span is not None:
+                clusters.setdefault(span, []).append(idx)
+        return list(clusters.items())
+
+    @staticmethod
+    def _join_tokens(solved):
+        # approximates the original spacing, see _render
         return " ".join(solved).\
             replace(" . ", ". ").\
             replace(" , ", ", ").\
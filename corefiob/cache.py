@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from corefiob.lang import PLURAL_ENDINGS
+
+
+class LRUCache:
+    # bounded in-process cache with optional TTL, safe to share between
+    # parsers and threads, values must be immutable (parsers store tuples)
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+def _to_json(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _from_json(data):
+    # json turns tuples into lists, parsers store tuples
+    def restore(obj):
+        if isinstance(obj, list):
+            return tuple(restore(o) for o in obj)
+        return obj
+    return restore(json.loads(data))
+
+
+class SQLiteCache:
+    # persistent cache on disk, shared by every process using the same file
+    # same interface as LRUCache, values must be json serializable
+    # (CorefIOB tags come back as plain strings, they still compare equal)
+    def __init__(self, path, max_entries=100000, ttl=None, timeout=30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._puts = 0
+        # counting rows on every write is wasteful, prune every few writes
+        # so the table may briefly hold up to prune_every extra entries
+        self.prune_every = max(1, min(64, max_entries // 16))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def conn(self):
+        # connections must not cross a fork, reconnect in child processes
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+            # WAL lets readers run concurrently with a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "created REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha1(_to_json(key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?",
+                                    (self._hash(key),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if self.ttl and created + self.ttl < time.time():
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (self._hash(key),))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _from_json(value)
+
+    def put(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                              (self._hash(key), _to_json(value), time.time()))
+            self._puts += 1
+            if self._puts % self.prune_every == 0:
+                self._evict()
+
+    def _evict(self):
+        # called with the lock held
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self.conn.execute("DELETE FROM cache WHERE key IN "
+                              "(SELECT key FROM cache ORDER BY created LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM cache")
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    @property
+    def stats(self):
+        with self._lock:
+            size = self._count()
+        total = self.hits + self.misses
+        return {"size": size,
+                "maxsize": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+class SignatureCache:
+    # memoizes iob tag sequences by sentence signature, pass an instance as
+    # HeuristicParser(memo=...), may be shared between parsers and languages
+    #
+    # the tagging rules only look at the POS tag and lexicon classes of each
+    # token, never at the words, so "turn on the lamp and make it red" and
+    # "turn on the fan and make it blue" share a signature and the second
+    # one is answered from the first without running the rule passes
+    # gazetteer phrase matches are part of the signature too
+    def __init__(self, maxsize=4096, store=None, max_tokens=100000):
+        # signature -> tags, any LRUCache/SQLiteCache like object
+        self.store = store if store is not None else LRUCache(maxsize)
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        # lexicon fingerprint -> {(token, ptag): token class}
+        self._tokens = {}
+        # token classes are interned, equal classes share one tuple
+        self._classes = {}
+
+    def _token_class(self, lexicon, token, ptag):
+        # everything HeuristicParser and RuleParser read from a token,
+        # (ptag, lexicon classes..., plural suffix)
+        # the class itself goes in the signature, not a counter, so keys stay
+        # valid for stores shared between processes or kept across restarts
+        index = lexicon.index
+        lower = token.lower()
+        endings = ("s",) + tuple(PLURAL_ENDINGS.get(lexicon.lang, []))
+        key = (ptag, index.get(token, 0), index.get(lower, 0), index.get(lower.strip(), 0),
+               index.get(lower.rstrip("s "), 0), token.endswith(endings))
+        with self._lock:
+            return self._classes.setdefault(key, key)
+
+    def signature(self, lexicon, postagged_toks):
+        tokens = self._tokens.get(lexicon.fingerprint)
+        if tokens is None or len(tokens) >= self.max_tokens:
+            # classes stay, so signatures stored so far are still valid
+            tokens = self._tokens[lexicon.fingerprint] = {}
+        get = tokens.get
+        signature = [get(pair) for pair in postagged_toks]
+        if None in signature:
+            for idx, (token, ptag) in enumerate(postagged_toks):
+                if signature[idx] is None:
+                    signature[idx] = tokens[(token, ptag)] = \
+                        self._token_class(lexicon, token, ptag)
+        if lexicon.phrases:
+            signature.extend(lexicon.phrases.match([token for token, _ in postagged_toks]))
+        return lexicon.fingerprint, tuple(signature)
+
+    def iob_tag(self, lexicon, postagged_toks, compute):
+        if not isinstance(postagged_toks, list):
+            postagged_toks = list(postagged_toks)
+        try:
+            key = self.signature(lexicon, postagged_toks)
+        except TypeError:  # lists from json, pairs must be hashable
+            postagged_toks = [(token, ptag) for token, ptag in postagged_toks]
+            key = self.signature(lexicon, postagged_toks)
+        tags = self.store.get(key)
+        if tags is None:
+            iob = compute(postagged_toks)
+            self.store.put(key, tuple(tag for _, _, tag in iob))
+            return iob
+        return [(token, ptag, tag) for (token, ptag), tag in zip(postagged_toks, tags)]
+
+    def clear(self):
+        self.store.clear()
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def stats(self):
+        return dict(self.store.stats, token_classes=len(self._classes))
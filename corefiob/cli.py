@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from corefiob import HeuristicParser
+
+# one warm parser per worker process
+_parser = None
+
+
+def _init_worker(lang, model, slim, tagger):
+    global _parser
+    _parser = HeuristicParser(lang, model, slim, tagger=tagger)
+    _parser.tagger.tag("")  # load the model before the first batch arrives
+
+
+def _run_batch(parser, mode, sentences, batch_size):
+    if mode == "iob":
+        return [[list(t) for t in iob]
+                for iob in parser.iob_tag_many(sentences, batch_size=batch_size)]
+    return list(parser.replace_corefs_many(sentences, batch_size=batch_size))
+
+
+def _process_batch(mode, sentences, batch_size=64, parser=None):
+    # returns a (result, error) pair per sentence, if the batch raises every
+    # sentence is retried alone so only the ones that fail get an error
+    parser = parser or _parser
+    try:
+        return [(result, None) for result in _run_batch(parser, mode, sentences, batch_size)]
+    except Exception:
+        pass
+    pairs = []
+    for sentence in sentences:
+        try:
+            pairs.append((_run_batch(parser, mode, [sentence], batch_size)[0], None))
+        except Exception as e:
+            pairs.append((None, f"{type(e).__name__}: {e}"))
+    return pairs
+
+
+def _read_records(stream, fmt, field):
+    # jsonl records that can not be processed are replaced by an error
+    # record naming their input line, so one bad line does not abort the run
+    for num, line in enumerate(stream, 1):
+        line = line.rstrip("\r\n")
+        if fmt == "jsonl":
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {"record": num, "error": f"invalid json: {e}"}
+                continue
+            if isinstance(record, str):
+                record = {field: record}
+            if not isinstance(record, dict):
+                yield {"record": num, "error": f"expected an object or a string, "
+                                              f"got {type(record).__name__}"}
+            elif not isinstance(record.get(field), str):
+                yield {"record": num, "error": f"missing text field {field!r}"}
+            else:
+                yield record
+        else:
+            yield {field: line}
+
+
+def _is_valid(record, field):
+    return isinstance(record, dict) and isinstance(record.get(field), str)
+
+
+def _split_chunk(chunk, field):
+    return [r[field] for r in chunk if _is_valid(r, field)]
+
+
+def _merge_chunk(chunk, field, results):
+    # records without a text field pass through with a None result, records
+    # the parser failed on get an error field and a None result
+    results = iter(results)
+    merged = []
+    for record in chunk:
+        result = None
+        if _is_valid(record, field):
+            result, error = next(results)
+            if error is not None:
+                record["error"] = error
+        merged.append((record, result))
+    return merged
+
+
+def _batched(iterable, n):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def process_stream(records, mode="replace", field="text", workers=1,
+                   chunksize=256, max_in_flight=None, batch_size=64,
+                   lang="en", model=None, slim=True, tagger="spacy"):
+    # yields (record, result) pairs in input order, at most max_in_flight
+    # chunks are queued at any time so memory does not grow with the input
+    # records without a string field are yielded as is with a None result,
+    # so are records the parser raised on, with the exception as their error
+    chunks = _batched(records, chunksize)
+    if workers <= 1:
+        parser = HeuristicParser(lang, model, slim, tagger=tagger)
+        for chunk in chunks:
+            results = _process_batch(mode, _split_chunk(chunk, field), batch_size, parser)
+            yield from _merge_chunk(chunk, field, results)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(lang, model, slim, tagger)) as pool:
+        for chunk in chunks:
+            fut = pool.submit(_process_batch, mode, _split_chunk(chunk, field), batch_size)
+            pending.append((chunk, fut))
+            if len(pending) >= max_in_flight:
+                chunk, fut = pending.popleft()
+                yield from _merge_chunk(chunk, field, fut.result())
+        while pending:
+            chunk, fut = pending.popleft()
+            yield from _merge_chunk(chunk, field, fut.result())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="corefiob",
+        description="tag or resolve coreferences in a text/jsonl corpus, one sentence per line")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="input file, defaults to stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output jsonl file, defaults to stdout")
+    parser.add_argument("-m", "--mode", choices=["replace", "iob"], default="replace")
+    parser.add_argument("-f", "--format", choices=["text", "jsonl"], default="text",
+                        help="input format, jsonl records are read from --field")
+    parser.add_argument("--field", default="text",
+                        help="jsonl field holding the sentence")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=256,
+                        help="sentences sent to a worker at once")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="max chunks queued at once, defaults to 2 * workers")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="nlp.pipe batch size inside each worker")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--tagger", default="spacy",
+                        help="POS tagger backend, spacy, nltk or lexicon")
+    parser.add_argument("--full", action="store_true",
+                        help="load the full spacy pipeline instead of the slim one")
+    args = parser.parse_args(argv)
+
+    fin = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    out_key = "iob" if args.mode == "iob" else "replaced"
+    try:
+        records = _read_records(fin, args.format, args.field)
+        for record, result in process_stream(records, args.mode, args.field,
+                                             args.workers, args.chunksize,
+                                             args.max_in_flight, args.batch_size,
+                                             args.lang, args.model, not args.full,
+                                             args.tagger):
+            if result is not None:
+                record[out_key] = result
+            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+
+if __name__ == "__main__":
+    main()
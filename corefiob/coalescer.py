@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RequestCoalescer:
+    # gathers concurrent async requests for up to max_delay seconds (or until
+    # max_batch are queued) and tags them with a single nlp.pipe call in an
+    # executor, so the event loop is never blocked by spacy
+    def __init__(self, parser, max_delay=0.005, max_batch=64, executor=None):
+        self.parser = parser
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        # one worker thread by default, spacy pipelines are not meant to be
+        # called concurrently and batching already amortizes the overhead
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, kind, sentence):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((kind, sentence, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush, loop)
+        return await future
+
+    def _flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        done = loop.run_in_executor(self.executor, self._run_batch, batch)
+        done.add_done_callback(lambda f: self._resolve(batch, f))
+
+    def _run_batch(self, batch):
+        # -> [(error, result)] per request
+        try:
+            iobs = list(self.parser.iob_tag_many([sentence for _, sentence, _ in batch],
+                                                 batch_size=len(batch)))
+        except Exception:
+            # one bad input must only fail its own caller, retry one by one
+            iobs = [None] * len(batch)
+        return [self._run_one(kind, sentence, iob)
+                for (kind, sentence, _), iob in zip(batch, iobs)]
+
+    def _run_one(self, kind, sentence, iob=None):
+        try:
+            if iob is None:
+                iob = self.parser.iob_tag(sentence)
+            return None, self.parser._render(sentence, iob) if kind == "replace" else iob
+        except Exception as e:
+            return e, None
+
+    @staticmethod
+    def _resolve(batch, done):
+        if done.cancelled():
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+            return
+        error = done.exception()
+        for idx, (_, _, future) in enumerate(batch):
+            if future.done():  # caller gave up waiting
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            item_error, result = done.result()[idx]
+            if item_error is not None:
+                future.set_exception(item_error)
+            else:
+                future.set_result(result)
+
+    @property
+    def stats(self):
+        return {"requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0}
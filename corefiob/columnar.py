@@ -0,0 +1,136 @@
+import threading
+
+from corefiob import CorefIOB, COREF_CLASSES
+
+# compact sentence representation used by the RuleParser passes
+# a sentence is a set of parallel lists, one int per token: POS codes, IOB codes
+# and lexicon classes, strings only come back when building the output tuples
+
+# IOB codes, B-/I-, role and kind are bit fields, 0 is "O"
+I_TAG = 1 << 0
+ENTITY = 1 << 1
+COREF = 1 << 2
+ROLE = ENTITY | COREF
+# kind, 3 bits
+FEMALE = 1 << 3
+MALE = 2 << 3
+NEUTRAL = 3 << 3
+INANIMATE = 4 << 3
+PLURAL = 5 << 3
+PLURAL_FEMALE = 6 << 3
+PLURAL_MALE = 7 << 3
+KIND = 7 << 3
+# HeuristicParser can copy the "" tag of the missing token before a sentence
+# into real tokens, it is kept apart from "O"
+BLANK = 1 << 6
+
+O = 0
+
+_KIND_NAMES = {FEMALE: "FEMALE", MALE: "MALE", NEUTRAL: "NEUTRAL",
+               INANIMATE: "INANIMATE", PLURAL: "PLURAL",
+               PLURAL_FEMALE: "PLURAL-FEMALE", PLURAL_MALE: "PLURAL-MALE"}
+
+
+def _tag_name(code):
+    if code == O:
+        return "O"
+    if code == BLANK:
+        return ""
+    role = "ENTITY" if code & ENTITY else "COREF"
+    return f"{'I' if code & I_TAG else 'B'}-{role}-{_KIND_NAMES[code & KIND]}"
+
+
+# code -> public tag, CorefIOB members where one exists
+TAG_NAMES = {}
+for _role in (ENTITY, COREF):
+    for _kind in _KIND_NAMES:
+        for _i in (0, I_TAG):
+            _code = _role | _kind | _i
+            _name = _tag_name(_code)
+            try:
+                TAG_NAMES[_code] = CorefIOB(_name)
+            except ValueError:
+                TAG_NAMES[_code] = _name
+TAG_NAMES[O] = "O"
+TAG_NAMES[BLANK] = ""
+TAG_CODES = {str(getattr(t, "value", t)): code for code, t in TAG_NAMES.items()}
+
+# pronoun code -> lexicon class bit, for corefs_after
+COREF_BITS = {TAG_CODES[tag.value]: bit for tag, bit in COREF_CLASSES.items()}
+
+
+def encode_tag(tag):
+    return TAG_CODES[str(getattr(tag, "value", tag))]
+
+
+def to_inside(code):
+    # tag.replace("B-", "I-")
+    return code | I_TAG if code & ROLE else code
+
+
+# POS codes, 0 is the "" of a missing neighbour, unknown tags get new codes
+POS_NAMES = ["", "ADJ", "ADP", "ADV", "AUX", "CCONJ", "DET", "INTJ", "NOUN",
+             "NUM", "PART", "PRON", "PROPN", "PUNCT", "SCONJ", "SYM", "VERB",
+             "X", "SPACE"]
+POS_CODES = {name: code for code, name in enumerate(POS_NAMES)}
+_POS_LOCK = threading.Lock()
+
+
+def pos_code(ptag):
+    code = POS_CODES.get(ptag)
+    if code is None:
+        with _POS_LOCK:
+            code = POS_CODES.setdefault(ptag, len(POS_CODES))
+    return code
+
+
+def pos_mask(ptags):
+    # set membership as a bit test, (1 << code) & mask
+    mask = 0
+    for ptag in ptags:
+        mask |= 1 << pos_code(ptag)
+    return mask
+
+
+class TokenTable:
+    # interns (token, POS tag) pairs, mapping each distinct pair to the POS bit
+    # and lexicon classes the passes need, so repeated tokens skip lower(),
+    # strip() and dict lookups
+    def __init__(self, lexicon, plural_endings=(), max_size=100000):
+        self.lexicon = lexicon
+        self.plural_endings = tuple(plural_endings)
+        self.max_size = max_size
+        self._rows = {}
+
+    def _row(self, token, ptag):
+        index = self.lexicon.index
+        lower = token.lower()
+        code = pos_code(ptag)
+        # (POS bit, exact, lowercase, pronoun, singular, plural suffix, POS code)
+        return (1 << code,
+                index.get(token, 0),
+                index.get(lower, 0),
+                index.get(lower.strip(), 0),
+                index.get(lower.rstrip("s "), 0),
+                token.endswith(self.plural_endings),
+                code)
+
+    def _add(self, pair):
+        rows = self._rows
+        if len(rows) >= self.max_size:
+            # rows are rebuilt on demand, starting over is always safe
+            rows = self._rows = {}
+        row = rows[pair] = self._row(*pair)
+        return row
+
+    def encode(self, postagged_toks):
+        # -> one tuple per field, see _row
+        # pairs are dict keys, so they must be (token, ptag) tuples
+        get = self._rows.get
+        encoded = [get(pair) or self._add(pair) for pair in postagged_toks]
+        if not encoded:
+            return (), (), (), (), (), (), ()
+        return tuple(zip(*encoded))
+
+    def __len__(self):
+        return len(self._rows)
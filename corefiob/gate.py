@@ -0,0 +1,51 @@
+import re
+import threading
+
+import corefiob.lang as _lang
+from corefiob import lexicon as lex
+
+
+class PronounGate:
+    # cheap check run on raw text before POS tagging, nothing can be resolved
+    # in a sentence without a pronoun, so it is returned as is
+    # pass an instance as HeuristicParser(gate=...)
+    #
+    # the scan is one compiled regex over the text, pronouns of the lexicon
+    # lists as whole words, plus the PRONOUN_SUFFIXES spellings the spacy
+    # tokenizer would split, eg "theyre", it errs on the side of tagging:
+    # "its" or "shell" open the gate, they are just tagged as usual
+    def __init__(self, lang="en"):
+        self.lang = lang
+        lexicon = lex.get_lexicon(lang)
+        pronouns = sorted((w for w, cls in lexicon.index.items() if cls & lex.COREF),
+                          key=len, reverse=True)
+        suffixes = sorted(_lang.PRONOUN_SUFFIXES.get(lang, []), key=len, reverse=True)
+        if pronouns:
+            pattern = r"(?<!\w)(?:%s)" % "|".join(map(re.escape, pronouns))
+            if suffixes:
+                pattern += r"(?:%s)?" % "|".join(map(re.escape, suffixes))
+            # lowercasing the text first beats re.IGNORECASE
+            self._regex = re.compile(pattern + r"(?!\w)")
+        else:
+            self._regex = None
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.fired = 0
+
+    def may_resolve(self, text):
+        # False if text has no pronoun, counts every call
+        found = self._regex is not None and self._regex.search(text.lower()) is not None
+        with self._lock:
+            self.checked += 1
+            self.fired += not found
+        return found
+
+    def reset(self):
+        with self._lock:
+            self.checked = self.fired = 0
+
+    @property
+    def stats(self):
+        return {"checked": self.checked,
+                "fired": self.fired,
+                "fire_rate": self.fired / self.checked if self.checked else 0.0}
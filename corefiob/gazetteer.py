@@ -0,0 +1,103 @@
+import corefiob.lang as _lang
+from corefiob import lexicon as lex
+
+# multi word entries of the lang.py entity lists, eg "living room light" in
+# INANIMATE_TOKENS, are matched as whole phrases instead of single tokens
+# lexicon class -> entity kind, a phrase in several lists takes the first
+# HUMAN phrases are neutral entities, names (PROPN) are then gendered by the
+# pronouns that follow them, other nouns only take neutral pronouns
+PHRASE_KINDS = ((lex.FEMALE, "FEMALE"), (lex.MALE, "MALE"), (lex.INANIMATE, "INANIMATE"),
+                (lex.HUMAN, "NEUTRAL"))
+
+_END = None
+
+
+def normalize(word):
+    # same normalization as the single word entity lookups
+    return word.lower().rstrip("s ")
+
+
+class TokenTrie:
+    # phrases as nested dicts, one level per normalized word, a match costs
+    # one dict lookup per token it visits whatever the number of phrases
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+        self.depth = 0
+
+    def add(self, phrase, value):
+        words = [normalize(w) for w in phrase.split()]
+        node = self.root
+        for w in words:
+            node = node.setdefault(w, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = node.get(_END, 0) | value
+        self.depth = max(self.depth, len(words))
+
+    def match(self, tokens):
+        # -> [(start, end, value)] of the longest phrase starting at the
+        # leftmost position, scanning on after each match, so spans never
+        # overlap and each token is visited at most depth times
+        words = [normalize(t) for t in tokens]
+        root = self.root
+        matches = []
+        n = len(words)
+        idx = 0
+        while idx < n:
+            node = root.get(words[idx])
+            best = None
+            end = idx + 1
+            while node is not None:
+                if _END in node:
+                    best = (idx, end, node[_END])
+                if end >= n:
+                    break
+                node = node.get(words[end])
+                end += 1
+            if best is None:
+                idx += 1
+            else:
+                matches.append(best)
+                idx = best[1]
+        return matches
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+
+def phrase_tags(matches, tokens, tags, ents, kind_tags, is_inside, index):
+    # idx -> new tag for every matched phrase, kind_tags is entity kind -> (B-, I-)
+    # the phrase takes over the ADJ/DET/NUM or nouns the entity pass already
+    # joined to it, eg "the" in "the smart tv", and a PREV_TOKENS word before it
+    writes = {}
+    for start, end, value in matches:
+        kind = next((kind for cls, kind in PHRASE_KINDS if value & cls), None)
+        if kind is None or kind not in kind_tags:
+            continue
+        while start > 0 and start - 1 in ents and is_inside(tags[start]):
+            start -= 1
+        while end < len(tags) and end in ents and is_inside(tags[end]):
+            end += 1
+        if start > 0 and start - 1 not in writes and \
+                index.get(tokens[start - 1].lower(), 0) & lex.PREV:
+            start -= 1
+        b, i = kind_tags[kind]
+        writes[start] = b
+        for idx in range(start + 1, end):
+            writes[idx] = i
+    return writes
+
+
+def extend_lexicon(lang, name, phrases):
+    # adds words or phrases to a lang.py list, eg a device name gazetteer
+    # extend_lexicon("en", "INANIMATE_TOKENS", ["living room light", "smart tv"])
+    # parsers created afterwards see them
+    if name not in lex.LEXICON_CLASSES:
+        raise ValueError(f"unknown lexicon list {name!r}, "
+                         f"available: {sorted(lex.LEXICON_CLASSES)}")
+    getattr(_lang, name).setdefault(lang, []).extend(phrases)
+    lex.clear_lexicons(lang)
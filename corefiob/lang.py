@@ -1,3 +1,5 @@
+SPACY_MODELS = {"en": "en_core_web_sm", "pt": "pt_core_news_sm"}
+
 PLURAL_ENDINGS = {"en": ["s"], "pt": ["s"]}
 JOINER_TOKENS = {"en": ["and"], "pt": ["e"]}
 PREV_TOKENS = {"en": ["my", "the"], "pt": ["o", "a", "os", "as"]}
@@ -24,4 +26,90 @@ FEMALE_TOKENS = {
 INANIMATE_TOKENS = {
     "en": ["cat", "dog", "bird", "lizard", "turtle", "spider", "snake", "fish",
            "light", "tv", "computer", "door", "window", "music"]
-}
\ No newline at end of file
+}
+# rule tables for corefiob.rules.RuleParser, the same heuristics as
+# HeuristicParser expressed as data so a language only needs new rows
+
+# entity kind of a noun, first matching row wins
+# (lexicon list matched against the lowercased token without plural suffix,
+#  or "PLURAL" for a token with a plural ending, or None to match anything,
+#  entity kind, whether an ADJ/DET/NUM two tokens back joins the entity)
+ENTITY_RULES = {
+    "en": [("FEMALE_TOKENS", "FEMALE", False),
+           ("MALE_TOKENS", "MALE", False),
+           ("INANIMATE_TOKENS", "INANIMATE", True),
+           ("PLURAL", "PLURAL", False),
+           (None, "NEUTRAL", True)]
+}
+# coref kind of a pronoun, first matching row wins
+# a NEUTRAL pronoun becomes PLURAL if the sentence has a plural entity
+PRONOUN_RULES = {
+    "en": [("INANIMATE_COREF_TOKENS", "INANIMATE"),
+           ("FEMALE_COREF_TOKENS", "FEMALE"),
+           ("MALE_COREF_TOKENS", "MALE"),
+           ("NEUTRAL_COREF_TOKENS", "NEUTRAL")]
+}
+# neutral nouns are re-gendered by the pronouns that follow them
+# (new kind, noun must be human, pronoun kind required after it,
+#  pronoun kind that blocks the rule, entity kind an I- token continues,
+#  how the B- token is placed when continuing: "prev2" also takes an
+#  ADJ/DET/NUM two tokens back, "prev" always re-tags the previous token,
+#  "new" only re-tags it if it is not already of the continued kind)
+NEUTRAL_ENTITY_RULES = {
+    "en": [("INANIMATE", False, "INANIMATE", "NEUTRAL", "INANIMATE", "prev2"),
+           ("MALE", True, "MALE", "FEMALE", "MALE", "new"),
+           ("FEMALE", True, "FEMALE", "MALE", "MALE", "prev")]
+}
+# entities are untagged when no later pronoun can refer to them
+# entity kind: (pronoun kind that keeps it,
+#               pronoun kinds that drop it if the first is missing, None for any)
+ENTITY_FILTER_RULES = {
+    "en": {"PLURAL": ("PLURAL", None),
+           "MALE": ("MALE", None),
+           "FEMALE": ("FEMALE", None),
+           "NEUTRAL": ("NEUTRAL", ["INANIMATE", "MALE", "FEMALE", "PLURAL"])}
+}
+
+# closed class words for corefiob.taggers.LexiconTagger, first listed tag wins
+# anything not listed is tagged NOUN, or PROPN when capitalized mid sentence
+CLOSED_CLASS_TAGS = {
+    "en": {
+        "DET": ["the", "a", "an", "this", "these", "those", "every", "each",
+                "some", "any", "no", "another"],
+        "PRON": ["i", "me", "you", "he", "him", "she", "her", "it", "we", "us",
+                 "they", "them", "my", "your", "his", "its", "our", "their",
+                 "mine", "yours", "hers", "ours", "theirs", "myself", "yourself",
+                 "himself", "herself", "itself", "ourselves", "themselves",
+                 "that", "what", "who", "which", "something", "everything"],
+        "ADP": ["of", "in", "on", "at", "for", "with", "to", "from", "by", "about",
+                "like", "into", "off", "out", "up", "down", "over", "under",
+                "around", "through", "after", "before", "as", "than"],
+        "CCONJ": ["and", "or", "but", "nor"],
+        "SCONJ": ["because", "if", "while", "since", "although", "though", "unless"],
+        "AUX": ["is", "are", "was", "were", "be", "been", "being", "am", "'re",
+                "'m", "do", "does", "did", "will", "would", "can", "could", "should",
+                "shall", "may", "might", "must", "ca", "wo"],
+        "PART": ["not", "n't", "to", "'s"],
+        "ADV": ["now", "then", "here", "there", "very", "too", "always", "never",
+                "just", "also", "again", "far", "away", "please", "so", "how",
+                "when", "where", "why"],
+        "ADJ": ["many", "much", "few", "several", "more", "most", "other", "all",
+                "good", "best", "better", "bad", "new", "old", "big", "small",
+                "red", "blue", "green", "white", "black", "yellow", "orange",
+                "purple", "pink", "bright", "dim", "warm", "cold", "hot", "loud",
+                "quiet"],
+        "VERB": ["turn", "make", "set", "switch", "open", "close", "take", "give",
+                 "play", "stop", "start", "pause", "resume", "put", "get", "show",
+                 "tell", "call", "text", "send", "read", "say", "said", "have",
+                 "has", "had", "love", "see", "want", "need", "lock", "unlock",
+                 "dim", "increase", "decrease", "raise", "lower", "mute", "unmute"],
+        "NUM": ["one", "two", "three", "four", "five", "six", "seven", "eight",
+                "nine", "ten", "hundred", "thousand"]
+    }
+}
+
+# endings the spacy tokenizer splits off a pronoun written without an
+# apostrophe, "theyre" -> "they" "re", for corefiob.gate.PronounGate
+PRONOUN_SUFFIXES = {
+    "en": ["d", "dve", "ll", "llve", "lve", "s", "re", "ve"]
+}
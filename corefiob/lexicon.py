@@ -0,0 +1,90 @@
+import hashlib
+import json
+
+import corefiob.lang as _lang
+
+# lexical classes, a token maps to the bitwise OR of every list it is in
+JOINER = 1 << 0
+PREV = 1 << 1
+HUMAN = 1 << 2
+MALE = 1 << 3
+FEMALE = 1 << 4
+INANIMATE = 1 << 5
+MALE_COREF = 1 << 6
+FEMALE_COREF = 1 << 7
+INANIMATE_COREF = 1 << 8
+NEUTRAL_COREF = 1 << 9
+PLURAL_COREF = 1 << 10
+PLURAL_MALE_COREF = 1 << 11
+PLURAL_FEMALE_COREF = 1 << 12
+
+COREF = MALE_COREF | FEMALE_COREF | INANIMATE_COREF | NEUTRAL_COREF | \
+        PLURAL_COREF | PLURAL_MALE_COREF | PLURAL_FEMALE_COREF
+
+LEXICON_CLASSES = {
+    "JOINER_TOKENS": JOINER,
+    "PREV_TOKENS": PREV,
+    "HUMAN_TOKENS": HUMAN,
+    "MALE_TOKENS": MALE,
+    "FEMALE_TOKENS": FEMALE,
+    "INANIMATE_TOKENS": INANIMATE,
+    "MALE_COREF_TOKENS": MALE_COREF,
+    "FEMALE_COREF_TOKENS": FEMALE_COREF,
+    "INANIMATE_COREF_TOKENS": INANIMATE_COREF,
+    "NEUTRAL_COREF_TOKENS": NEUTRAL_COREF,
+    "PLURAL_COREF_TOKENS": PLURAL_COREF,
+    "PLURAL_MALE_COREF_TOKENS": PLURAL_MALE_COREF,
+    "PLURAL_FEMALE_COREF_TOKENS": PLURAL_FEMALE_COREF
+}
+
+
+class Lexicon:
+    def __init__(self, lang, index, fingerprint, phrases=None):
+        self.lang = lang
+        # token -> class bitmask, tokens are stored exactly as in lang.py
+        # callers normalize (lower/strip) the same way the heuristics always did
+        self.index = index
+        self.fingerprint = fingerprint
+        # multi word entries, a corefiob.gazetteer.TokenTrie
+        self.phrases = phrases
+
+    def get(self, token):
+        return self.index.get(token, 0)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def compile_lexicon(lang):
+    from corefiob.gazetteer import TokenTrie
+    index = {}
+    phrases = TokenTrie()
+    lists = {}
+    for name, cls in LEXICON_CLASSES.items():
+        words = getattr(_lang, name).get(lang, [])
+        lists[name] = sorted(words)
+        for w in words:
+            if " " in w.strip():
+                phrases.add(w, cls)
+            else:
+                index[w] = index.get(w, 0) | cls
+    fingerprint = hashlib.sha1(json.dumps(lists, sort_keys=True).encode("utf-8")).hexdigest()
+    return Lexicon(lang, index, fingerprint, phrases)
+
+
+_LEXICONS = {}
+
+
+def get_lexicon(lang):
+    # compiled once per language and shared by every parser
+    if lang not in _LEXICONS:
+        _LEXICONS[lang] = compile_lexicon(lang)
+    return _LEXICONS[lang]
+
+
+def clear_lexicons(lang=None):
+    # call after editing the lang.py lists at runtime
+    if lang is None:
+        _LEXICONS.clear()
+    else:
+        _LEXICONS.pop(lang, None)
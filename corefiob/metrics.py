@@ -0,0 +1,39 @@
+import threading
+from collections import Counter, defaultdict
+
+
+class ParserMetrics:
+    # collects per stage durations and rule hit counters, pass an instance as
+    # HeuristicParser(metrics=...) and read .stats, or subclass it and override
+    # record_stage/record_rules to forward the numbers to a metrics system
+    # parsers only check `metrics is None`, so nothing is measured without one
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_calls = Counter()
+        self.stage_seconds = defaultdict(float)
+        self.rule_hits = Counter()
+
+    def record_stage(self, stage, seconds):
+        with self._lock:
+            self.stage_calls[stage] += 1
+            self.stage_seconds[stage] += seconds
+
+    def record_rules(self, hits):
+        # hits is a Counter of rule name -> times it fired in one iob_tag call
+        with self._lock:
+            self.rule_hits.update(hits)
+
+    def reset(self):
+        with self._lock:
+            self.stage_calls.clear()
+            self.stage_seconds.clear()
+            self.rule_hits.clear()
+
+    @property
+    def stats(self):
+        with self._lock:
+            stages = {stage: {"calls": calls,
+                              "total_ms": self.stage_seconds[stage] * 1000,
+                              "mean_us": self.stage_seconds[stage] / calls * 1e6}
+                      for stage, calls in self.stage_calls.items()}
+            return {"stages": stages, "rules": dict(self.rule_hits)}
@@ -0,0 +1,163 @@
+import gc
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+def _rss():
+    # resident set size of this process in bytes, None where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class _Entry:
+    __slots__ = ("nlp", "lang", "load_seconds", "size", "hits", "last_used")
+
+    def __init__(self, nlp, lang, load_seconds, size):
+        self.nlp = nlp
+        self.lang = lang
+        self.load_seconds = load_seconds
+        self.size = size
+        self.hits = 0
+        self.last_used = 0
+
+
+class ModelRegistry:
+    # spacy models loaded on first use and shared by every parser, keyed by
+    # (model, slim), least recently used models are dropped once the resident
+    # size of the loaded models goes over max_bytes (None keeps everything)
+    #
+    # a hit takes no lock, SpacyTagger asks for its model on every call, and
+    # a model is loaded outside the registry lock, so loading one model only
+    # blocks the callers waiting for that same model
+    #
+    # sizes are the RSS growth while loading, an estimate since other threads
+    # allocate too, pass sizer=callable(nlp) -> bytes to measure differently
+    def __init__(self, max_bytes=None, sizer=None, loader=None):
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.loader = loader
+        self._entries = {}
+        # key -> Future of a load in progress
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._clock = itertools.count(1)
+        self.evictions = 0
+
+    def _load(self, model, exclude):
+        if self.loader is not None:
+            return self.loader(model, exclude=exclude)
+        import spacy
+        return spacy.load(model, exclude=exclude)
+
+    def load(self, model, slim=False):
+        key = (model, slim)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load_entry(key)
+        # unlocked, a lost update only skews the stats and eviction order
+        entry.hits += 1
+        entry.last_used = next(self._clock)
+        return entry.nlp
+
+    def _load_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            pending = self._loading.get(key)
+            loading = pending is None
+            if loading:
+                pending = self._loading[key] = Future()
+        if not loading:
+            return pending.result()
+
+        model, slim = key
+        try:
+            from corefiob import SLIM_EXCLUDE
+            before = _rss()
+            start = time.perf_counter()
+            nlp = self._load(model, SLIM_EXCLUDE if slim else [])
+            seconds = time.perf_counter() - start
+            if self.sizer is not None:
+                size = self.sizer(nlp)
+            else:
+                after = _rss()
+                size = max(after - before, 0) if before is not None else 0
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            pending.set_exception(e)
+            raise
+        entry = _Entry(nlp, getattr(nlp, "lang", None), seconds, size)
+        entry.last_used = next(self._clock)
+        with self._lock:
+            self._entries[key] = entry
+            del self._loading[key]
+            evicted = self._enforce_budget(keep=key)
+        if evicted:
+            # spacy pipelines are full of reference cycles
+            gc.collect()
+        pending.set_result(entry)
+        return entry
+
+    def _enforce_budget(self, keep):
+        # called with the lock held, True if anything was dropped
+        if self.max_bytes is None:
+            return False
+        evicted = False
+        while self.resident_bytes > self.max_bytes:
+            candidates = [k for k in self._entries if k != keep]
+            if not candidates:
+                break
+            self._drop(min(candidates, key=lambda k: self._entries[k].last_used))
+            evicted = True
+        return evicted
+
+    def _drop(self, key):
+        del self._entries[key]
+        self.evictions += 1
+
+    def evict(self, model, slim=False):
+        with self._lock:
+            if (model, slim) not in self._entries:
+                return
+            self._drop((model, slim))
+        gc.collect()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+        gc.collect()
+
+    @property
+    def resident_bytes(self):
+        return sum(entry.size for entry in list(self._entries.values()))
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        # model -> load time, resident size and uses, least recently used first
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: item[1].last_used)
+        return {f"{model}{' (slim)' if slim else ''}": {
+            "lang": entry.lang,
+            "load_ms": entry.load_seconds * 1000,
+            "size_mb": entry.size / 2 ** 20,
+            "hits": entry.hits}
+            for (model, slim), entry in entries}
+
+
+# used by load_nlp, replace the budget with REGISTRY.max_bytes = ...
+REGISTRY = ModelRegistry()
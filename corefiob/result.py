@@ -0,0 +1,43 @@
+class CorefResult:
+    # everything one tagging pass gives, returned by HeuristicParser.resolve
+    #
+    #   result = parser.resolve("Turn on the lights and make them blue")
+    #   result.tokens    # ["Turn", "on", "the", "lights", "and", "make", "them", "blue"]
+    #   result.tags      # ["O", "O", "B-ENTITY-INANIMATE", "I-ENTITY-INANIMATE", ...]
+    #   result.clusters  # [((2, 3), [6])], antecedent -> pronoun token indexes
+    #   result.resolved  # "Turn on the lights and make the lights blue"
+    #
+    # the resolved text is only rendered when asked for, then kept
+    __slots__ = ("text", "iob", "clusters", "_parser", "_rendered")
+
+    def __init__(self, parser, text, iob):
+        self.text = text
+        self.iob = iob
+        self.clusters = parser._resolve_clusters(iob)
+        self._parser = parser
+        self._rendered = None
+
+    @property
+    def tokens(self):
+        return [tok for tok, _, _ in self.iob]
+
+    @property
+    def tags(self):
+        return [tag for _, _, tag in self.iob]
+
+    def _render(self):
+        if self._rendered is None:
+            self._rendered = self._parser._render(self.text, self.iob, return_edits=True)
+        return self._rendered
+
+    @property
+    def resolved(self):
+        return self._render()[0]
+
+    @property
+    def edits(self):
+        # (char_start, char_end, replacement) into text, see replace_corefs
+        return self._render()[1]
+
+    def __repr__(self):
+        return f"CorefResult(text={self.text!r}, clusters={self.clusters!r})"
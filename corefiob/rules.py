@@ -0,0 +1,412 @@
+import time
+from collections import Counter
+
+import corefiob.lang as _lang
+from corefiob import CorefIOB, HeuristicParser, PHRASE_TAGS
+from corefiob import columnar as col
+from corefiob import lexicon as lex
+from corefiob.gazetteer import phrase_tags
+
+# POS tag sets as bitmasks over columnar POS codes, test with (1 << code) & mask
+NOUN_TAGS = col.pos_mask(["NOUN", "PROPN"])
+HELPER_TAGS = col.pos_mask(["ADJ", "DET", "NUM"])
+SPAN_TAGS = NOUN_TAGS | HELPER_TAGS | col.pos_mask(["ADP"])
+TRAILING_TAGS = HELPER_TAGS | col.pos_mask(["ADP"])
+ADP = col.pos_mask(["ADP"])
+PROPN = col.pos_mask(["PROPN"])
+# POS bit of a neighbour outside the sentence, matches no tag set
+MISSING = col.pos_mask([""])
+
+PRONOUN_KINDS = {
+    "MALE": lex.MALE_COREF,
+    "FEMALE": lex.FEMALE_COREF,
+    "NEUTRAL": lex.NEUTRAL_COREF,
+    "INANIMATE": lex.INANIMATE_COREF,
+    "PLURAL": lex.PLURAL_COREF
+}
+
+# tags that are never rewritten by the final IOB sequence fix-up
+_FIXED_TAGS = {col.O} | {col.COREF | kind for kind in
+                         (col.MALE, col.FEMALE, col.INANIMATE, col.NEUTRAL,
+                          col.PLURAL, col.PLURAL_FEMALE, col.PLURAL_MALE)}
+_ENTITY_PLURAL = col.encode_tag(CorefIOB.ENTITY_PLURAL)
+_ENTITY_PLURAL_I = col.encode_tag(CorefIOB.ENTITY_PLURAL_I)
+
+# special ENTITY_RULES matchers
+_ANY = -1
+_PLURAL = -2
+
+
+def _entity_tags(kind):
+    return (col.encode_tag(CorefIOB["ENTITY_" + kind]),
+            col.encode_tag(CorefIOB["ENTITY_" + kind + "_I"]))
+
+
+def _kind_name(code):
+    # "female", "inanimate" ... of an IOB code, for the rule hit names
+    return col.TAG_NAMES[code].split("-", 2)[2].lower()
+
+
+def _pronoun_mask(kinds):
+    mask = 0
+    for kind in kinds:
+        mask |= PRONOUN_KINDS[kind]
+    return mask
+
+
+class RuleTable:
+    def __init__(self, lang):
+        self.lang = lang
+        self.lexicon = lex.get_lexicon(lang)
+        self.plural_endings = tuple(_lang.PLURAL_ENDINGS.get(lang, []))
+        self.tokens = col.TokenTable(self.lexicon, self.plural_endings)
+
+        # (lexicon class | _PLURAL | _ANY, B- tag, I- tag, joins ADJ/DET/NUM 2 tokens back)
+        self.entity_rules = []
+        for words, kind, extends in _lang.ENTITY_RULES.get(lang, []):
+            if words is None:
+                test = _ANY
+            elif words == "PLURAL":
+                test = _PLURAL
+            else:
+                test = lex.LEXICON_CLASSES[words]
+            self.entity_rules.append((test, *_entity_tags(kind), extends))
+
+        # (lexicon class, coref tag, pronoun kind)
+        self.pronoun_rules = [(lex.LEXICON_CLASSES[words],
+                               col.encode_tag(CorefIOB["COREF_" + kind]),
+                               PRONOUN_KINDS[kind])
+                              for words, kind in _lang.PRONOUN_RULES.get(lang, [])]
+
+        # entity kind -> (B- tag, I- tag) of gazetteer phrases
+        self.phrase_tags = {kind: _entity_tags(kind) for kind in PHRASE_TAGS}
+
+        self.neutral_tags = set(_entity_tags("NEUTRAL"))
+        # (B- tag, I- tag, noun must be human, required pronoun kind,
+        #  blocking pronoun kind, tags an I- token continues, B- placement)
+        self.neutral_rules = []
+        for kind, human, required, blocking, continues, placement in \
+                _lang.NEUTRAL_ENTITY_RULES.get(lang, []):
+            self.neutral_rules.append((*_entity_tags(kind), human,
+                                       PRONOUN_KINDS[required], PRONOUN_KINDS[blocking],
+                                       _entity_tags(continues), placement))
+
+        # entity tag -> (pronoun kinds that keep it, pronoun kinds that drop it)
+        self.entity_filters = {}
+        for kind, (keep, drop) in _lang.ENTITY_FILTER_RULES.get(lang, {}).items():
+            drop = None if drop is None else _pronoun_mask(drop)
+            for tag in _entity_tags(kind):
+                self.entity_filters[tag] = (PRONOUN_KINDS[keep], drop)
+
+
+_TABLES = {}
+
+
+def get_rule_table(lang):
+    # compiled once per lexicon and shared by every parser, a lexicon
+    # recompiled after lex.clear_lexicons gets a new table
+    table = _TABLES.get(lang)
+    if table is None or table.lexicon is not lex.get_lexicon(lang):
+        table = _TABLES[lang] = RuleTable(lang)
+    return table
+
+
+# the tagging engine of HeuristicParser.iob_tag, driven by the rule tables in
+# lang.py, tokens are scanned once forwards to tag entities and pronouns, once backwards
+# to index the pronouns after each token, and once more to apply the IOB
+# sequence fix-ups while building the output tuples
+# the passes work on columnar int lists (corefiob.columnar), POS tags as bits,
+# IOB tags as bit field codes and lexicon classes per interned token
+class RuleParser(HeuristicParser):
+
+    def __init__(self, lang="en", model=None, slim=False, cache=None, tagger="spacy",
+                 metrics=None, memo=None, gate=None):
+        super().__init__(lang, model, slim, cache, tagger, metrics, memo, gate)
+        self.rules = get_rule_table(self.lang)
+
+    @property
+    def _columnar(self):
+        return self
+
+    def _iob_tag(self, postagged_toks):
+        if isinstance(postagged_toks, str):
+            postagged_toks = self.pos_tag(postagged_toks)
+        postagged_toks, pbits, cols = self._encode_pairs(postagged_toks)
+        tags = [col.O] * len(pbits)
+        if self.metrics is not None:
+            return self._iob_tag_instrumented(postagged_toks, pbits, cols, tags)
+        ents, prons = self._forward_pass(pbits, cols, tags, postagged_toks)
+        corefs_after = self._corefs_after(tags, prons)
+        self._resolve_entities(pbits, cols, tags, ents, corefs_after)
+        return self._fixup_pass(postagged_toks, pbits, tags)
+
+    def _encode_pairs(self, postagged_toks):
+        if not isinstance(postagged_toks, list):
+            postagged_toks = list(postagged_toks)
+        try:
+            pbits, *cols = self.rules.tokens.encode(postagged_toks)
+        except TypeError:  # lists from json, pairs must be hashable
+            postagged_toks = [(token, ptag) for token, ptag in postagged_toks]
+            pbits, *cols = self.rules.tokens.encode(postagged_toks)
+        return postagged_toks, pbits, cols
+
+    def _tag_codes(self, postagged_toks):
+        # same passes as _iob_tag, returns the columnar IOB codes instead of
+        # (token, ptag, tag) tuples, see col.TAG_NAMES
+        postagged_toks, pbits, cols = self._encode_pairs(postagged_toks)
+        tags = [col.O] * len(pbits)
+        ents, prons = self._forward_pass(pbits, cols, tags, postagged_toks)
+        corefs_after = self._corefs_after(tags, prons)
+        self._resolve_entities(pbits, cols, tags, ents, corefs_after)
+        return self._fixup_codes(pbits, tags)
+
+    def _candidate_iob(self, postagged_toks):
+        # the entities of postagged_toks tagged as if pronouns of every kind
+        # followed them, the antecedent candidates HeuristicParser carries
+        # to the next chunk or turn, pronouns are left untagged
+        # a full stop ends the text, the entity rules look at the next token
+        postagged_toks, pbits, cols = self._encode_pairs(postagged_toks + [(".", "PUNCT")])
+        tags = [col.O] * len(pbits)
+        ents = self._tag_entities(pbits, cols, tags, postagged_toks)
+        self._resolve_entities(pbits, cols, tags, ents, [lex.COREF] * (len(pbits) + 1))
+        return self._fixup_pass(postagged_toks, pbits, tags)[:-1]
+
+    def _iob_tag_instrumented(self, postagged_toks, pbits, cols, tags):
+        # the passes one by one, reporting timings and rule hits to self.metrics
+        hits = Counter()
+        t = time.perf_counter()
+        ents, prons = self._forward_pass(pbits, cols, tags, postagged_toks, hits)
+        t = self._record_stage("forward_pass", t)
+        corefs_after = self._corefs_after(tags, prons)
+        t = self._record_stage("corefs_after", t)
+        self._resolve_entities(pbits, cols, tags, ents, corefs_after, hits)
+        t = self._record_stage("resolve_entities", t)
+        iob = self._fixup_pass(postagged_toks, pbits, tags)
+        self._record_stage("fixup_pass", t)
+        self.metrics.record_rules(hits)
+        return iob
+
+    def _record_stage(self, stage, start):
+        now = time.perf_counter()
+        self.metrics.record_stage(stage, now - start)
+        return now
+
+    @staticmethod
+    def _corefs_after(tags, prons):
+        # corefs_after[i] is the bitmask of pronoun classes tagged anywhere after i
+        # answers "is there a later male/female/... pronoun" in O(1)
+        n = len(tags)
+        at = [0] * (n + 1)
+        for idx, code in prons.items():
+            at[idx] |= col.COREF_BITS[code]
+        after = [0] * (n + 1)
+        for idx in range(n - 1, -1, -1):
+            after[idx] = after[idx + 1] | at[idx + 1]
+        return after
+
+    def _forward_pass(self, pbits, cols, tags, postagged_toks=None, hits=None):
+        # hits, if given, is a Counter of the rules that fired
+        ents = self._tag_entities(pbits, cols, tags, postagged_toks, hits)
+        return ents, self._tag_prons(cols, tags, ents)
+
+    def _tag_entities(self, pbits, cols, tags, postagged_toks=None, hits=None):
+        rules = self.rules
+        exact, lower, _, clean, plural = cols[:5]
+        to_inside = col.to_inside
+        n = len(pbits)
+        ents = {}
+
+        # the last token can never be a valid coreference entity
+        for idx in range(n - 1):
+            tag = tags[idx]
+            ptag = pbits[idx]
+            if idx > 0:
+                prevptag, prevtag = pbits[idx - 1], tags[idx - 1]
+                prevexact, prevlower = exact[idx - 1], lower[idx - 1]
+            else:
+                # HeuristicParser pads with ("", "", "")
+                prevptag, prevtag, prevexact, prevlower = MISSING, col.BLANK, 0, 0
+            prev2ptag = pbits[idx - 2] if idx > 1 else MISSING
+            nxtptag = pbits[idx + 1]
+            nxt2ptag = pbits[idx + 2] if idx + 2 < n else MISSING
+
+            # nouns of the form "NOUN of NOUN" or "NOUN of the ADJ NOUN"
+            if ptag == ADP and prevtag & col.ENTITY and nxtptag & NOUN_TAGS:
+                if hits is not None:
+                    hits["entities.is_adp"] += 1
+                newtag = to_inside(prevtag)
+                tags[idx] = tags[idx + 1] = newtag
+                ents[idx] = ents[idx + 1] = newtag
+                continue
+
+            # plurals of the format NOUN and NOUN
+            if exact[idx] & lex.JOINER and prevptag & NOUN_TAGS and nxtptag & NOUN_TAGS:
+                if hits is not None:
+                    hits["entities.is_conjunction"] += 1
+                tags[idx - 1] = ents[idx - 1] = _ENTITY_PLURAL
+                tags[idx] = ents[idx] = _ENTITY_PLURAL_I
+                tags[idx + 1] = ents[idx + 1] = _ENTITY_PLURAL_I
+                continue
+
+            if not ptag & NOUN_TAGS or prevexact & lex.JOINER:
+                # handle NOUN of the NOUN
+                if ptag == ADP and prevtag != col.O and \
+                        nxtptag & SPAN_TAGS and nxt2ptag & NOUN_TAGS:
+                    if hits is not None:
+                        hits["entities.noun_of_the_noun"] += 1
+                    t = to_inside(prevtag)
+                    tags[idx] = tags[idx + 1] = tags[idx + 2] = t
+                    ents[idx] = ents[idx + 1] = ents[idx + 2] = t
+                continue
+
+            # join multi word nouns
+            if prevptag == ptag:
+                if hits is not None:
+                    hits["entities.multi_word"] += 1
+                tags[idx] = ents[idx] = to_inside(prevtag)
+                continue
+
+            clean_class = clean[idx]
+            # include adjectives and determinants
+            first = not (prevptag & HELPER_TAGS or prevlower & lex.PREV)
+            for test, b, i, extends in rules.entity_rules:
+                if test == _ANY or \
+                        (test == _PLURAL and plural[idx]) or \
+                        (test > 0 and clean_class & test):
+                    if hits is not None:
+                        hits["entities." + _kind_name(b)] += 1
+                    if first:
+                        tags[idx] = ents[idx] = b
+                    elif extends and prev2ptag & HELPER_TAGS:
+                        tags[idx - 2] = ents[idx - 2] = b
+                        tags[idx - 1] = ents[idx - 1] = i
+                        tags[idx] = ents[idx] = i
+                    else:
+                        tags[idx - 1] = ents[idx - 1] = b
+                        tags[idx] = ents[idx] = i
+                    break
+
+            # handle sequential NOUN words
+            if nxtptag & SPAN_TAGS and nxt2ptag & SPAN_TAGS:
+                if hits is not None:
+                    hits["entities.sequential_nouns"] += 1
+                t = to_inside(tag)
+                tags[idx + 1] = tags[idx + 2] = t
+                ents[idx + 1] = ents[idx + 2] = t
+
+        if postagged_toks is not None and rules.lexicon.phrases:
+            self._tag_phrases(postagged_toks, tags, ents, hits)
+        return ents
+
+    def _tag_prons(self, cols, tags, ents):
+        prons = {}
+        has_plural = None
+        for idx, pron_class in enumerate(cols[2]):
+            if not pron_class & lex.COREF:
+                continue
+            for mask, coref, kind in self.rules.pronoun_rules:
+                if pron_class & mask:
+                    if kind == lex.NEUTRAL_COREF:
+                        if has_plural is None:
+                            has_plural = _ENTITY_PLURAL in ents.values()
+                        if has_plural:
+                            coref = col.COREF | col.PLURAL
+                    tags[idx] = prons[idx] = coref
+                    break
+        return prons
+
+    def _tag_phrases(self, postagged_toks, tags, ents, hits=None):
+        tokens = [token for token, _ in postagged_toks]
+        matches = self.rules.lexicon.phrases.match(tokens)
+        if matches:
+            if hits is not None:
+                hits["entities.gazetteer"] += len(matches)
+            writes = phrase_tags(matches, tokens, tags, ents, self.rules.phrase_tags,
+                                 lambda tag: tag & col.I_TAG, self.rules.lexicon.index)
+            for idx, tag in writes.items():
+                tags[idx] = ents[idx] = tag
+
+    def _resolve_entities(self, pbits, cols, tags, ents, corefs_after, hits=None):
+        rules = self.rules
+        clean = cols[3]
+        to_inside = col.to_inside
+        # if there is no pronoun after the entity, then nothing can corefer to it
+        bad_ents = {idx for idx in ents if not corefs_after[idx]}
+        if hits is not None and bad_ents:
+            hits["disambiguate.no_coref_after"] += len(bad_ents)
+
+        # re-gender neutral entities from the pronouns that follow them
+        for ent, tag in ents.items():
+            if ent in bad_ents or tag not in rules.neutral_tags:
+                continue
+            ptag = pbits[ent]
+            if not ptag & NOUN_TAGS:
+                continue
+            corefs = corefs_after[ent]
+            prevptag, prevtag = pbits[ent - 1], tags[ent - 1]
+            prev2ptag = pbits[ent - 2] if ent > 1 else MISSING
+            is_human = bool(clean[ent] & lex.HUMAN) or ptag == PROPN
+
+            for b, i, needs_human, required, blocking, continues, placement in rules.neutral_rules:
+                if is_human != needs_human or not corefs & required or corefs & blocking:
+                    continue
+                if hits is not None:
+                    hits["disambiguate.neutral_to_" + _kind_name(b)] += 1
+                if tag & col.I_TAG or prevtag == tag or prevtag in continues:
+                    tag = i
+                    if placement == "prev2" and prev2ptag & HELPER_TAGS:
+                        tags[ent - 2] = ents[ent - 2] = b
+                        tags[ent - 1] = ents[ent - 1] = i
+                    elif placement != "new" or prevtag not in continues:
+                        tags[ent - 1] = ents[ent - 1] = b
+                else:
+                    tag = b
+                tags[ent] = ents[ent] = tag
+                break
+
+            if prevptag & SPAN_TAGS and prev2ptag & (HELPER_TAGS | NOUN_TAGS):
+                t = to_inside(tag)
+                tags[ent - 1] = ents[ent - 1] = t
+                tags[ent] = ents[ent] = t
+
+        for idx in bad_ents:
+            ents.pop(idx, None)
+            tags[idx] = col.O
+
+        # untag entities whose kind no later pronoun can match
+        filters = rules.entity_filters
+        for ent, tag in ents.items():
+            if tag not in filters:
+                continue
+            keep, drop = filters[tag]
+            corefs = corefs_after[ent]
+            if not corefs & keep and (drop is None or corefs & drop):
+                if hits is not None:
+                    hits["filter." + _kind_name(tag)] += 1
+                tags[ent] = col.O
+
+    @staticmethod
+    def _fixup_pass(postagged_toks, pbits, tags):
+        # also converts back to the public (token, ptag, tag) tuples
+        names = col.TAG_NAMES
+        return [(token, ptag, names[tag]) for (token, ptag), tag
+                in zip(postagged_toks, RuleParser._fixup_codes(pbits, tags))]
+
+    @staticmethod
+    def _fixup_codes(pbits, tags):
+        n = len(tags)
+        fixed = []
+        for idx in range(n):
+            tag = tags[idx]
+            if tag not in _FIXED_TAGS:
+                prevtag = tags[idx - 1] if idx > 0 else col.O
+                nxttag = tags[idx + 1] if idx + 1 < n else col.O
+                # fix sequential B-ENTITY B-ENTITY -> B-ENTITY I-ENTITY
+                if tag & col.ROLE and not tag & col.I_TAG and \
+                        prevtag & ~col.I_TAG == tag:
+                    tag |= col.I_TAG
+                # fix trailing not-nouns
+                if pbits[idx] & TRAILING_TAGS and nxttag == col.O:
+                    tag = col.O
+            fixed.append(tag)
+        return fixed
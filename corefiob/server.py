@@ -0,0 +1,336 @@
+import argparse
+import gc
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from corefiob import HeuristicParser
+
+# local HTTP server, stdlib only and fully offline
+#
+#   corefiob-server --port 8080 --workers 4
+#   curl -d '{"text": "Turn on the lights and make them blue"}' localhost:8080/replace_corefs
+#
+# the model is loaded once in the parent process, workers are forked after
+# that and share its memory copy-on-write, every worker batches the requests
+# that arrive together into one nlp.pipe call
+#
+#   POST /iob_tag         {"text": ...} or {"texts": [...]} -> {"iob": ...}
+#   POST /replace_corefs  {"text": ...} or {"texts": [...]} -> {"replaced": ...}
+#   GET  /health          {"status": "ok", ...}
+#   GET  /stats           request counts, latency percentiles and batch sizes
+#
+# stats are per worker process, each answers with its own pid
+
+
+class _Batcher:
+    # a thread that drains the queued requests, waiting up to max_delay
+    # seconds (or until max_batch are queued) to tag them in one go
+    def __init__(self, parser, max_delay=0.002, max_batch=64):
+        self.parser = parser
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending = deque()
+        self._ready = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="corefiob-batcher", daemon=True)
+        self._thread.start()
+
+    def submit_many(self, kind, sentences):
+        # blocks until every sentence is done, they are queued together so
+        # they land in the same batch
+        futures = [Future() for _ in sentences]
+        with self._ready:
+            self._pending.extend((kind, sentence, future)
+                                 for sentence, future in zip(sentences, futures))
+            self._ready.notify()
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        with self._ready:
+            while not self._pending:
+                self._ready.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            return [self._pending.popleft()
+                    for _ in range(min(len(self._pending), self.max_batch))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                iobs = list(self.parser.iob_tag_many([sentence for _, sentence, _ in batch],
+                                                     batch_size=len(batch)))
+            except Exception:
+                # one bad input must only fail its own request, retry one by one
+                iobs = [None] * len(batch)
+            for item, iob in zip(batch, iobs):
+                self._finish(item, iob)
+
+    def _finish(self, item, iob=None):
+        kind, sentence, future = item
+        try:
+            if iob is None:
+                iob = self.parser.iob_tag(sentence)
+            if kind == "replace_corefs":
+                future.set_result(self.parser._render(sentence, iob))
+            else:
+                future.set_result([list(t) for t in iob])
+        except Exception as e:
+            future.set_exception(e)
+
+    @property
+    def stats(self):
+        return {"requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0}
+
+
+class _Latencies:
+    # request counts and the last `window` latencies of every endpoint
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+        self._errors = {}
+
+    def record(self, endpoint, seconds, error=False):
+        with self._lock:
+            if endpoint not in self._samples:
+                self._samples[endpoint] = deque(maxlen=self.window)
+                self._counts[endpoint] = self._errors[endpoint] = 0
+            self._samples[endpoint].append(seconds)
+            self._counts[endpoint] += 1
+            self._errors[endpoint] += error
+
+    @property
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for endpoint, samples in self._samples.items():
+                ordered = sorted(samples)
+                pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+                stats[endpoint] = {"requests": self._counts[endpoint],
+                                   "errors": self._errors[endpoint],
+                                   "mean_ms": sum(ordered) / len(ordered) * 1000,
+                                   "p50_ms": pick(0.5),
+                                   "p95_ms": pick(0.95),
+                                   "p99_ms": pick(0.99)}
+            return stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "corefiob"
+    protocol_version = "HTTP/1.1"
+    ENDPOINTS = ("iob_tag", "replace_corefs")
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        app = self.server.app
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "pid": os.getpid(),
+                              "lang": app.parser.lang, "model": app.parser.model,
+                              "uptime": time.monotonic() - app.started})
+        elif self.path == "/stats":
+            self._reply(200, {"pid": os.getpid(), "endpoints": app.latencies.stats,
+                              "batching": app.batcher.stats})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        app = self.server.app
+        endpoint = self.path.strip("/")
+        if endpoint not in self.ENDPOINTS:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if "texts" in body:
+                texts, single = body["texts"], False
+                if not isinstance(texts, list):
+                    raise TypeError("texts must be a list")
+            else:
+                texts, single = [body["text"]], True
+            if not all(isinstance(text, str) for text in texts):
+                raise TypeError("texts must be strings")
+        except (ValueError, KeyError, TypeError) as e:
+            app.latencies.record(endpoint, time.perf_counter() - start, error=True)
+            self._reply(400, {"error": f"expected {{\"text\": ...}} or {{\"texts\": [...]}}: {e}"})
+            return
+        try:
+            results = app.batcher.submit_many(endpoint, texts)
+        except Exception as e:
+            app.latencies.record(endpoint, time.perf_counter() - start, error=True)
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        key = "iob" if endpoint == "iob_tag" else "replaced"
+        app.latencies.record(endpoint, time.perf_counter() - start)
+        self._reply(200, {key: results[0] if single else results})
+
+    def address_string(self):
+        # unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.app.verbose:
+            super().log_message(format, *args)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CorefServer:
+    def __init__(self, parser=None, host="127.0.0.1", port=8080, unix_socket=None,
+                 workers=1, max_batch=64, max_delay=0.002, verbose=False):
+        self.parser = parser or HeuristicParser(slim=True)
+        self.workers = workers
+        self.verbose = verbose
+        self.batcher = _Batcher(self.parser, max_delay, max_batch)
+        self.latencies = _Latencies()
+        self.started = time.monotonic()
+        self._children = set()
+        self._stopping = False
+        # load the model before binding and forking, so workers share it
+        self.parser.tagger.tag("")
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            self.httpd = _ThreadingUnixServer(unix_socket, _Handler)
+        else:
+            self.httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.app = self
+        self.unix_socket = unix_socket
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def _serve(self):
+        # batcher threads are started after forking, threads do not survive fork
+        self.batcher.start()
+        self.httpd.serve_forever()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                self._serve()
+            finally:
+                os._exit(0)
+        self._children.add(pid)
+
+    def serve_forever(self):
+        if self.workers <= 1 or not hasattr(os, "fork"):
+            self._serve()
+            return
+        # objects created so far are never collected, their pages stay shared
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        signal.signal(signal.SIGTERM, lambda *_: self.shutdown())
+        try:
+            self._supervise()
+        except KeyboardInterrupt:
+            self.shutdown()
+            self._supervise()
+        finally:
+            self.httpd.server_close()
+
+    def _supervise(self):
+        while self._children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            self._children.discard(pid)
+            # a crashed worker is replaced
+            if not self._stopping:
+                self._spawn()
+
+    def shutdown(self):
+        self._stopping = True
+        if self._children:
+            for pid in list(self._children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    self._children.discard(pid)
+        else:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="corefiob-server",
+        description="serve iob_tag and replace_corefs over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix-socket", default=None,
+                        help="listen on a unix socket instead of host:port")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="forked worker processes sharing the loaded model")
+    parser.add_argument("--max-batch", type=int, default=64,
+                        help="max requests tagged in one nlp.pipe call")
+    parser.add_argument("--max-delay", type=float, default=0.002,
+                        help="seconds a request waits for others to batch with")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--tagger", default="spacy",
+                        help="POS tagger backend, spacy, nltk or lexicon")
+    parser.add_argument("--engine", choices=["heuristic", "rules"], default="heuristic")
+    parser.add_argument("--full", action="store_true",
+                        help="load the full spacy pipeline instead of the slim one")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    if args.engine == "rules":
+        from corefiob.rules import RuleParser as parser_class
+    else:
+        parser_class = HeuristicParser
+    coref = parser_class(args.lang, args.model, not args.full, tagger=args.tagger)
+    server = CorefServer(coref, args.host, args.port, args.unix_socket, args.workers,
+                         args.max_batch, args.max_delay, args.verbose)
+    where = server.unix_socket or "http://%s:%s" % server.address[:2]
+    print(f"corefiob serving on {where} with {args.workers} workers", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
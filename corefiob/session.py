@@ -0,0 +1,62 @@
+import time
+
+
+class CorefSession:
+    # resolves a dialogue turn by turn, every utterance is tagged on its own
+    # and resolved against the last female/male/neutral/inanimate/plural
+    # entity of the previous turns, so "turn it off" finds "the kitchen
+    # light" from the turn before without tagging that turn again
+    #
+    # an entity is forgotten once it was last mentioned more than max_turns
+    # turns or ttl seconds ago (None disables either limit), per turn cost
+    # does not grow with history
+    KINDS = ("female", "male", "neutral", "inanimate", "plural")
+
+    def __init__(self, parser=None, max_turns=None, ttl=None, clock=time.monotonic):
+        if parser is None:
+            from corefiob import HeuristicParser
+            parser = HeuristicParser()
+        self.parser = parser
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.clock = clock
+        self.turn = 0
+        # kind -> (antecedent, turn, timestamp)
+        self._antecedents = {}
+
+    def _expired(self, turn, timestamp, now):
+        if self.max_turns is not None and self.turn - turn > self.max_turns:
+            return True
+        return self.ttl is not None and now - timestamp > self.ttl
+
+    def _expire(self, now):
+        for kind, (_, turn, timestamp) in list(self._antecedents.items()):
+            if self._expired(turn, timestamp, now):
+                del self._antecedents[kind]
+
+    def resolve(self, utterance, return_edits=False):
+        # returns the utterance with its pronouns replaced, see replace_corefs
+        now = self.clock()
+        self.turn += 1
+        self._expire(now)
+
+        # tagged even without pronouns, its entities are needed later on
+        iob = self.parser.iob_tag(self.parser.pos_tag(utterance))
+        resolved = self.parser._render(utterance, iob, self.antecedents,
+                                       return_edits=return_edits)
+
+        # kept in the order they were last mentioned, see _resolve_iob
+        mentioned = {}
+        self.parser._carry_antecedents(mentioned, iob)
+        for kind, text in mentioned.items():
+            self._antecedents.pop(kind, None)
+            self._antecedents[kind] = (text, self.turn, now)
+        return resolved
+
+    @property
+    def antecedents(self):
+        return {kind: text for kind, (text, _, _) in self._antecedents.items()}
+
+    def reset(self):
+        self.turn = 0
+        self._antecedents.clear()
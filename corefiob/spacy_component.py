@@ -0,0 +1,72 @@
+from spacy.language import Language
+from spacy.tokens import Doc, Token
+
+from corefiob import columnar as col
+
+# spacy pipeline component, needs token.pos_ from earlier components
+#
+#   nlp = spacy.load("en_core_web_sm")
+#   nlp.add_pipe("corefiob")
+#   doc = nlp("Turn on the lights and make them blue")
+#   doc._.coref_resolved  # "Turn on the lights and make the lights blue"
+#
+# everything is stored as plain strings/ints in doc.user_data, so the results
+# survive Doc serialization and nlp.pipe(..., n_process=N)
+
+Token.set_extension("coref_iob", default="O", force=True)
+# [[antecedent token indexes, pronoun token indexes]]
+Doc.set_extension("coref_clusters", default=None, force=True)
+Doc.set_extension("coref_resolved", default=None, force=True)
+
+# IOB code -> tag string, see corefiob.columnar
+_TAG_VALUES = {code: tag for tag, code in col.TAG_CODES.items()}
+
+
+def _splice(doc, texts, clusters):
+    # the antecedents are spliced in at token.idx, as HeuristicParser._render
+    # does from the offsets it has to search for
+    replaced = sorted((pron, " ".join(texts[idx] for idx in ents))
+                      for ents, prons in clusters for pron in prons)
+    text = doc.text
+    chunks = []
+    last = 0
+    for pron, antecedent in replaced:
+        start = doc[pron].idx
+        chunks.append(text[last:start])
+        chunks.append(antecedent)
+        last = start + len(texts[pron])
+    chunks.append(text[last:])
+    return "".join(chunks)
+
+
+class CorefIOBComponent:
+    def __init__(self, name="corefiob", lang="en"):
+        from corefiob import HeuristicParser
+        self.name = name
+        self.lang = lang
+        self.parser = HeuristicParser(lang)
+
+    def __call__(self, doc):
+        # token attributes go straight into the columnar passes, no
+        # (token, ptag, tag) tuples are built
+        texts = [token.text for token in doc]
+        codes = self.parser._columnar._tag_codes(zip(texts, [token.pos_ for token in doc]))
+        for token, code in zip(doc, codes):
+            token._.coref_iob = _TAG_VALUES[code]
+        clusters = self.parser._tag_clusters([col.TAG_NAMES[code] for code in codes])
+        doc._.coref_clusters = [[list(ents), prons] for ents, prons in clusters]
+        doc._.coref_resolved = _splice(doc, texts, clusters)
+        return doc
+
+    def __reduce__(self):
+        # rebuilt from its settings in worker processes, the parser is not pickled
+        return CorefIOBComponent, (self.name, self.lang)
+
+
+@Language.factory("corefiob",
+                  default_config={"lang": None},
+                  requires=["token.pos"],
+                  assigns=["token._.coref_iob", "doc._.coref_clusters",
+                           "doc._.coref_resolved"])
+def make_corefiob(nlp, name, lang):
+    return CorefIOBComponent(name, lang or nlp.lang)
@@ -0,0 +1,158 @@
+import re
+
+import corefiob.lang as _lang
+
+# POS tagger backends, selected with HeuristicParser(tagger=name)
+# a backend tags raw text (tag), pre-tokenized text (tag_tokens) and
+# batches of text (tag_many), returning lists of (token, UPOS tag)
+
+
+class SpacyTagger:
+    name = "spacy"
+
+    def __init__(self, lang="en", model=None, slim=False):
+        self.lang = lang
+        self.model = model or _lang.SPACY_MODELS.get(lang)
+        self.slim = slim
+
+    @property
+    def nlp(self):
+        from corefiob import load_nlp
+        return load_nlp(self.model, self.slim)
+
+    def tokenize(self, text):
+        # the tokenizer alone, none of the pipes change the tokens
+        return [token.text for token in self.nlp.make_doc(text)]
+
+    def tag(self, text):
+        return [(token.text, token.pos_) for token in self.nlp(text)]
+
+    def _tagging_pipes(self):
+        # pos_ only needs tok2vec + tagger/morphologizer + attribute_ruler
+        from corefiob import SLIM_EXCLUDE
+        return [proc for name, proc in self.nlp.pipeline if name not in SLIM_EXCLUDE]
+
+    def _doc(self, tokens):
+        # tokens are joined by single spaces, the text is never read back
+        from spacy.tokens import Doc
+        words = list(tokens)
+        spaces = [True] * (len(words) - 1) + [False] if words else []
+        return Doc(self.nlp.vocab, words=words, spaces=spaces)
+
+    def tag_tokens(self, tokens):
+        # pre-tokenized input keeps its tokens, same tags as tag() would give
+        doc = self._doc(tokens)
+        for proc in self._tagging_pipes():
+            doc = proc(doc)
+        return [(token.text, token.pos_) for token in doc]
+
+    def tag_many(self, texts, batch_size=64, n_process=1):
+        texts = (t if isinstance(t, str) else self._doc(t) for t in texts)
+        for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+            yield [(token.text, token.pos_) for token in doc]
+
+
+# nltk universal tags that are spelled differently in spacy
+NLTK_TO_UPOS = {".": "PUNCT", "CONJ": "CCONJ", "PRT": "PART"}
+
+
+class NLTKTagger:
+    name = "nltk"
+
+    def __init__(self, lang="en", model=None, slim=False):
+        from nltk.tag.perceptron import PerceptronTagger
+        self.lang = lang
+        # loading the perceptron weights is the slow part, do it once
+        self._tagger = PerceptronTagger()
+
+    def tokenize(self, text):
+        from nltk import word_tokenize
+        return word_tokenize(text)
+
+    def tag(self, text):
+        return self.tag_tokens(self.tokenize(text))
+
+    def tag_tokens(self, tokens):
+        from nltk.tag.mapping import map_tag
+        tagged = []
+        for token, tag in self._tagger.tag(list(tokens)):
+            tag = map_tag("en-ptb", "universal", tag)
+            tagged.append((token, NLTK_TO_UPOS.get(tag, tag)))
+        return tagged
+
+    def tag_many(self, texts, batch_size=64, n_process=1):
+        for text in texts:
+            yield self.tag(text)
+
+
+class LexiconTagger:
+    # closed class word lists from lang.CLOSED_CLASS_TAGS, anything else is
+    # a NOUN (PROPN if capitalized mid sentence), for constrained command
+    # domains where loading a statistical tagger is not worth it
+    name = "lexicon"
+    TOKEN_REGEX = re.compile(r"\w+(?=n't)|n't|'\w+|\w+|[^\w\s]")
+
+    def __init__(self, lang="en", model=None, slim=False):
+        self.lang = lang
+        self.tags = {}
+        for pos, words in _lang.CLOSED_CLASS_TAGS.get(lang, {}).items():
+            for w in words:
+                self.tags.setdefault(w, pos)
+
+    def tokenize(self, text):
+        return self.TOKEN_REGEX.findall(text)
+
+    def tag(self, text):
+        return self.tag_tokens(self.tokenize(text))
+
+    def tag_tokens(self, tokens):
+        tagged = []
+        sentence_start = True
+        for token in tokens:
+            lower = token.lower()
+            if lower in self.tags:
+                tag = self.tags[lower]
+            elif not token[0].isalnum() and token[0] not in "'":
+                tag = "PUNCT"
+            elif token.isdigit():
+                tag = "NUM"
+            elif token[0].isupper() and not sentence_start:
+                tag = "PROPN"
+            elif len(lower) > 4 and lower.endswith("ly"):
+                tag = "ADV"
+            elif len(lower) > 4 and lower.endswith("ed"):
+                tag = "VERB"
+            else:
+                tag = "NOUN"
+            tagged.append((token, tag))
+            sentence_start = token in (".", "!", "?")
+        return tagged
+
+    def tag_many(self, texts, batch_size=64, n_process=1):
+        for text in texts:
+            yield self.tag(text)
+
+
+POS_TAGGERS = {
+    "spacy": SpacyTagger,
+    "nltk": NLTKTagger,
+    "lexicon": LexiconTagger
+}
+
+
+def register_tagger(name, tagger_class):
+    POS_TAGGERS[name] = tagger_class
+
+
+_TAGGERS = {}
+
+
+def get_tagger(name="spacy", lang="en", model=None, slim=False):
+    # backends are shared between parsers with the same settings
+    key = (name, lang, model, slim)
+    if key not in _TAGGERS:
+        if name not in POS_TAGGERS:
+            raise ValueError(f"unknown POS tagger {name!r}, "
+                             f"available: {sorted(POS_TAGGERS)}")
+        _TAGGERS[key] = POS_TAGGERS[name](lang, model, slim)
+    return _TAGGERS[key]
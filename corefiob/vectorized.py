@@ -0,0 +1,328 @@
+import threading
+from itertools import chain
+
+import numpy as np
+
+from corefiob import columnar as col
+from corefiob import lexicon as lex
+from corefiob.rules import RuleParser, ADP, HELPER_TAGS, NOUN_TAGS, SPAN_TAGS, \
+    TRAILING_TAGS, _ANY, _PLURAL, _ENTITY_PLURAL, _ENTITY_PLURAL_I, _FIXED_TAGS
+
+# per token flags computed for the whole batch at once
+_A1 = 1 << 0  # ADP followed by a NOUN, "NOUN of NOUN"
+_CJ = 1 << 1  # joiner between two NOUNs, "NOUN and NOUN"
+_GATE = 1 << 2  # not a NOUN, or right after a joiner
+_A3 = 1 << 3  # ADP followed by ADJ/DET/NUM/ADP/NOUN and a NOUN, "NOUN of the NOUN"
+_SAME = 1 << 4  # same POS as the previous token, multi word noun
+_FIRST = 1 << 5  # no ADJ/DET/NUM or PREV_TOKENS word before it
+_H2 = 1 << 6  # ADJ/DET/NUM two tokens back
+_SEQ = 1 << 7  # followed by two span tokens
+_RULE_SHIFT = 8  # index of the first matching ENTITY_RULES entry
+
+# padding columns on each side of a row, enough for the prev2/nxt2 windows
+_PAD = 2
+
+
+def _pos_lut(mask):
+    # POS code -> is the code in the bitmask
+    return np.array([bool((1 << code) & mask) for code in range(len(col.POS_CODES))])
+
+
+def _tag_lut(values, dtype):
+    # IOB code -> value
+    lut = np.zeros(max(col.TAG_NAMES) + 1, dtype=dtype)
+    for code, value in values.items():
+        lut[code] = value
+    return lut
+
+
+_COREF_BITS = _tag_lut(col.COREF_BITS, np.int64)
+_FIXED = _tag_lut({code: True for code in _FIXED_TAGS}, bool)
+_NAMES = np.array([col.TAG_NAMES.get(code, "O") for code in range(len(_FIXED))],
+                  dtype=object)
+
+
+class _Batch:
+    # layout of a batch of sentences as padded (rows, width) int arrays
+    def __init__(self, lengths, features):
+        self.lengths = lengths
+        self.n_rows = len(lengths)
+        self.maxlen = max(lengths)
+        self.width = self.maxlen + 2 * _PAD
+        self.total = sum(lengths)
+        # position of every token of the flattened batch in the padded arrays
+        starts = np.cumsum([0] + lengths[:-1])
+        self.rows = np.repeat(np.arange(self.n_rows), lengths)
+        self.cols = np.arange(self.total) - np.repeat(starts, lengths) + _PAD
+        # (rows, width, fields) TokenTable rows of every token, 0 in the padding
+        self.packed = np.zeros((self.n_rows, self.width, features.shape[1]), dtype=np.int64)
+        self.packed[self.rows, self.cols] = features
+
+    def field(self, idx):
+        # TokenTable._row field for every token
+        return self.packed[:, :, idx]
+
+    def pack(self, flat):
+        arr = np.zeros((self.n_rows, self.width), dtype=np.int64)
+        arr[self.rows, self.cols] = flat
+        return arr
+
+    def at(self, arr, offset=0):
+        # (rows, maxlen) view of each token's neighbour at offset
+        return arr[:, _PAD + offset:_PAD + offset + self.maxlen]
+
+
+# batch version of RuleParser for offline tagging of many sentences, single
+# sentences (iob_tag) still go through RuleParser
+# sentences are packed into padded int arrays (POS code, lexicon classes) and
+# the neighbour window tests of the forward pass, the pronoun lookup, the
+# pronoun index and the IOB fix-ups run as array shifts and masks over the
+# whole batch, what is left per sentence is a loop over the few tokens where an
+# entity rule can fire and the entity resolution of RuleParser
+# needs numpy
+class BatchParser(RuleParser):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (token, ptag) -> row of self._features, TokenTable rows without the
+        # POS bit: exact, lowercase, pronoun, singular, plural suffix, POS code
+        self._ids = {}
+        self._features = np.zeros((0, 6), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _encode(self, pairs):
+        # flat (token, ptag) pairs -> (n, 6) features, new pairs are interned
+        with self._lock:
+            ids = self._ids
+            if len(ids) >= self.rules.tokens.max_size:
+                ids.clear()
+                self._features = self._features[:0]
+            get = ids.get
+            flat = [get(pair, -1) for pair in pairs]
+            if -1 in flat:
+                row = self.rules.tokens._row
+                new = []
+                for k, pair in enumerate(pairs):
+                    if flat[k] < 0:
+                        idx = get(pair)
+                        if idx is None:
+                            idx = ids[pair] = len(self._features) + len(new)
+                            new.append(row(*pair)[1:])
+                        flat[k] = idx
+                self._features = np.concatenate(
+                    [self._features, np.array(new, dtype=np.int64)])
+            return self._features[np.array(flat, dtype=np.intp)]
+
+    def iob_tag_batch(self, sentences):
+        # list of POS tagged sentences -> list of iob tagged sentences
+        sentences = [s if isinstance(s, list) else list(s) for s in sentences]
+        lengths = [len(s) for s in sentences]
+        if not sentences or not any(lengths):
+            return [[] for _ in sentences]
+        pairs = list(chain.from_iterable(sentences))
+        try:
+            features = self._encode(pairs)
+        except TypeError:  # lists from json, pairs must be hashable
+            pairs = [(token, ptag) for token, ptag in pairs]
+            features = self._encode(pairs)
+        batch = _Batch(lengths, features)
+        codes = batch.field(5)
+
+        flags, coref = self._batch_predicates(batch, codes)
+        tags_rows = []
+        ents_rows = []
+        has_plural = []
+        phrases = self.rules.lexicon.phrases
+        for postagged_toks, flagged, n in zip(sentences, flags, lengths):
+            if flagged:
+                tags = [col.O] * n
+                ents = self._sparse_forward(flagged, tags)
+            else:
+                tags = ents = None
+            if phrases:
+                if tags is None:
+                    tags, ents = [col.O] * n, {}
+                self._tag_phrases(postagged_toks, tags, ents)
+            has_plural.append(bool(ents) and _ENTITY_PLURAL in ents.values())
+            tags_rows.append(tags)
+            ents_rows.append(ents)
+        has_plural = np.array(has_plural, dtype=bool)
+
+        # neutral pronouns become plural if the sentence has a plural entity
+        coref[(coref == col.COREF | col.NEUTRAL) & has_plural[:, None]] = col.COREF | col.PLURAL
+        after = self._batch_corefs_after(coref)
+        padded = batch.pack(0)
+        tagged = batch.at(padded)
+        tagged[:] = coref
+
+        # entity resolution only where an entity was found, entities without a
+        # pronoun after them are always dropped, so rows where no entity has
+        # one only lose the pronoun tags written over their entities
+        with_after = (after != 0).any(axis=1).tolist()
+        dropped_rows, dropped_idxs = [], []
+        for row, (tags, ents) in enumerate(zip(tags_rows, ents_rows)):
+            if not ents:
+                continue
+            if not with_after[row]:
+                dropped_rows.extend([row] * len(ents))
+                dropped_idxs.extend(ents)
+                continue
+            n = lengths[row]
+            for idx, code in enumerate(coref[row, :n].tolist()):
+                if code:
+                    tags[idx] = code
+            cols = batch.packed[row, _PAD:_PAD + n].T.tolist()
+            self._resolve_entities([1 << code for code in cols[5]], cols, tags, ents,
+                                   after[row].tolist())
+            tagged[row, :n] = tags
+        tagged[dropped_rows, dropped_idxs] = col.O
+
+        names = self._batch_fixup(batch, codes, padded)
+        iob = [(token, ptag, name) for (token, ptag), name in zip(pairs, names)]
+        results = []
+        start = 0
+        for n in lengths:
+            results.append(iob[start:start + n])
+            start += n
+        return results
+
+    def _batch_predicates(self, batch, codes):
+        rules = self.rules
+        at = batch.at
+        exact = batch.field(0)
+        lower = batch.field(1)
+
+        is_noun = _pos_lut(NOUN_TAGS)[codes]
+        is_helper = _pos_lut(HELPER_TAGS)[codes]
+        is_span = _pos_lut(SPAN_TAGS)[codes]
+        cur_adp = at(_pos_lut(ADP)[codes])
+        joiner = (exact & lex.JOINER) != 0
+
+        flags = np.zeros((batch.n_rows, batch.maxlen), dtype=np.int64)
+        flags |= _A1 * (cur_adp & at(is_noun, 1))
+        flags |= _CJ * (at(joiner) & at(is_noun, -1) & at(is_noun, 1))
+        flags |= _GATE * (~at(is_noun) | at(joiner, -1))
+        flags |= _A3 * (cur_adp & at(is_span, 1) & at(is_noun, 2))
+        flags |= _SAME * (at(codes, -1) == at(codes))
+        flags |= _FIRST * ~(at(is_helper, -1) | (at(lower, -1) & lex.PREV != 0))
+        flags |= _H2 * at(is_helper, -2)
+        flags |= _SEQ * (at(is_span, 1) & at(is_span, 2))
+
+        # first matching entity rule, _ANY matches everything, len(entity_rules)
+        # if none does
+        rule = np.full(flags.shape, len(rules.entity_rules), dtype=np.int64)
+        clean = at(batch.field(3))
+        plural = at(batch.field(4)) != 0
+        for idx in range(len(rules.entity_rules) - 1, -1, -1):
+            test = rules.entity_rules[idx][0]
+            if test == _ANY:
+                rule[:] = idx
+            elif test == _PLURAL:
+                rule[plural] = idx
+            else:
+                rule[(clean & test) != 0] = idx
+        flags |= rule << _RULE_SHIFT
+
+        # only tokens where some branch of the forward pass can write a tag,
+        # the last token of a sentence never can
+        position = np.arange(batch.maxlen)
+        active = (position < np.array(batch.lengths)[:, None] - 1) & \
+            (((flags & (_A1 | _CJ | _A3)) != 0) | ((flags & _GATE) == 0))
+        rows, idxs = np.nonzero(active)
+        flags_rows = [[] for _ in range(batch.n_rows)]
+        for row, idx, f in zip(rows.tolist(), idxs.tolist(), flags[rows, idxs].tolist()):
+            flags_rows[row].append((idx, f))
+
+        # pronoun tag of every token, before the plural check
+        pron = at(batch.field(2))
+        coref = np.zeros_like(pron)
+        for mask, code, _ in reversed(rules.pronoun_rules):
+            coref[(pron & mask) != 0] = code
+        return flags_rows, coref
+
+    def _sparse_forward(self, flagged, tags):
+        # the tag dependent part of RuleParser._forward_pass, only visiting
+        # the tokens _batch_predicates marked as active
+        entity_rules = self.rules.entity_rules
+        to_inside = col.to_inside
+        ents = {}
+        for idx, f in flagged:
+            tag = tags[idx]
+            prevtag = tags[idx - 1] if idx > 0 else col.BLANK
+
+            if f & _A1 and prevtag & col.ENTITY:
+                newtag = to_inside(prevtag)
+                tags[idx] = tags[idx + 1] = newtag
+                ents[idx] = ents[idx + 1] = newtag
+                continue
+
+            if f & _CJ:
+                tags[idx - 1] = ents[idx - 1] = _ENTITY_PLURAL
+                tags[idx] = ents[idx] = _ENTITY_PLURAL_I
+                tags[idx + 1] = ents[idx + 1] = _ENTITY_PLURAL_I
+                continue
+
+            if f & _GATE:
+                if f & _A3 and prevtag != col.O:
+                    t = to_inside(prevtag)
+                    tags[idx] = tags[idx + 1] = tags[idx + 2] = t
+                    ents[idx] = ents[idx + 1] = ents[idx + 2] = t
+                continue
+
+            if f & _SAME:
+                tags[idx] = ents[idx] = to_inside(prevtag)
+                continue
+
+            rule = f >> _RULE_SHIFT
+            if rule < len(entity_rules):
+                _, b, i, extends = entity_rules[rule]
+                if f & _FIRST:
+                    tags[idx] = ents[idx] = b
+                elif extends and f & _H2:
+                    tags[idx - 2] = ents[idx - 2] = b
+                    tags[idx - 1] = ents[idx - 1] = i
+                    tags[idx] = ents[idx] = i
+                else:
+                    tags[idx - 1] = ents[idx - 1] = b
+                    tags[idx] = ents[idx] = i
+
+            if f & _SEQ:
+                t = to_inside(tag)
+                tags[idx + 1] = tags[idx + 2] = t
+                ents[idx + 1] = ents[idx + 2] = t
+        return ents
+
+    @staticmethod
+    def _batch_corefs_after(coref):
+        # RuleParser._corefs_after for every row, a reversed cumulative OR
+        bits = _COREF_BITS[coref]
+        after = np.zeros_like(bits)
+        after[:, :-1] = np.bitwise_or.accumulate(bits[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        return after
+
+    @staticmethod
+    def _batch_fixup(batch, codes, tags):
+        # RuleParser._fixup_pass for every row, returns the flat list of tag names
+        at = batch.at
+        cur = at(tags)
+        fixed = _FIXED[cur]
+        # fix sequential B-ENTITY B-ENTITY -> B-ENTITY I-ENTITY
+        seq = ~fixed & ((cur & col.ROLE) != 0) & ((cur & col.I_TAG) == 0) & \
+            ((at(tags, -1) & ~col.I_TAG) == cur)
+        out = np.where(seq, cur | col.I_TAG, cur)
+        # fix trailing not-nouns
+        trailing = ~fixed & at(_pos_lut(TRAILING_TAGS)[codes]) & (at(tags, 1) == col.O)
+        out[trailing] = col.O
+        return _NAMES[out[batch.rows, batch.cols - _PAD]].tolist()
+
+    def iob_tag_many(self, sentences, batch_size=1024, n_process=1):
+        # lazily yields results in input order, tagged batch_size at a time
+        # (the result cache is not used here)
+        batch = []
+        for postagged_toks in self.pos_tag_many(sentences, min(batch_size, 256), n_process):
+            batch.append(postagged_toks)
+            if len(batch) >= batch_size:
+                yield from self.iob_tag_batch(batch)
+                batch = []
+        if batch:
+            yield from self.iob_tag_batch(batch)
@@ -6,6 +6,11 @@ setup(
     packages=['corefiob'],
     license='',
     install_requires=[],
+    entry_points={
+        'console_scripts': ['corefiob=corefiob.cli:main',
+                            'corefiob-server=corefiob.server:main'],
+        'spacy_factories': ['corefiob=corefiob.spacy_component:make_corefiob']
+    },
     author='jarbasai',
     author_email='',
     description=''
@@ -348,3 +348,573 @@ class TestHeuristicParser(unittest.TestCase):
              ('a', 'DET', 'O'),
              ('good', 'ADJ', 'O'),
              ('leader', 'NOUN', 'O')])
+
+    def test_many(self):
+        sentences = ["The girl said she would take the trash out",
+                     "Turn on the lights and make them blue",
+                     "Here is the book now take it"]
+        self.assertEqual(list(solver.iob_tag_many(sentences, batch_size=2)),
+                         [solver.iob_tag(s) for s in sentences])
+        self.assertEqual(list(solver.replace_corefs_many(sentences, batch_size=2)),
+                         [solver.replace_corefs(s) for s in sentences])
+
+    def test_stream(self):
+        chunks = ["I have many friends.", "They are an important part of my life"]
+        self.assertEqual(list(solver.replace_corefs_stream(chunks)),
+                         ["I have many friends.",
+                          "many friends are an important part of my life"])
+        # without a context window the last entity of each kind is carried over
+        self.assertEqual(list(solver.replace_corefs_stream(chunks, window=0)),
+                         ["I have many friends.",
+                          "many friends are an important part of my life"])
+        # the pronoun is further away than the window
+        parser = HeuristicParser(tagger="lexicon")
+        chunks = ["I switched on the kitchen light.", "I was so tired", "Please turn it off."]
+        for window in [0, 3, 32]:
+            self.assertEqual(list(parser.replace_corefs_stream(chunks, window=window))[-1],
+                             "Please turn the kitchen light off.")
+        # a carried plural does not win over a closer neutral entity
+        chunks = ["I have many friends.", "I greeted the teacher and they waved"]
+        self.assertEqual(list(parser.replace_corefs_stream(chunks, window=0))[-1],
+                         "I greeted the teacher and the teacher waved")
+        iob = [("kids", "NOUN", "B-ENTITY-PLURAL"), ("met", "VERB", "O"),
+               ("Sam", "PROPN", "B-ENTITY-NEUTRAL"), ("and", "CCONJ", "O"),
+               ("they", "PRON", "B-COREF-NEUTRAL")]
+        self.assertEqual(parser._resolve_iob(iob, {"plural": "the kids"})[-1], "Sam")
+        self.assertEqual(parser._resolve_clusters(iob), [((2,), [4])])
+
+    def test_edits(self):
+        sentence = "Turn on the lights and make them blue"
+        text, edits = solver.replace_corefs(sentence, return_edits=True)
+        self.assertEqual(text, "Turn on the lights and make the lights blue")
+        self.assertEqual(edits, [(28, 32, "the lights")])
+        self.assertEqual(sentence[28:32], "them")
+
+    def test_resolve(self):
+        sentence = "Turn on the lights and make them blue"
+        result = solver.resolve(sentence)
+        self.assertEqual(result.iob, solver.iob_tag(sentence))
+        self.assertEqual(result.tokens, [tok for tok, _, _ in result.iob])
+        self.assertEqual(result.clusters, [((2, 3), [6])])
+        self.assertEqual(result.resolved, solver.replace_corefs(sentence))
+        self.assertEqual(result.edits, [(28, 32, "the lights")])
+        self.assertFalse(hasattr(result, "__dict__"))
+        # POS tagged and pre-tokenized input, as for iob_tag and pos_tag
+        postagged = [(tok, pos) for tok, pos, _ in result.iob]
+        self.assertEqual(solver.resolve(postagged).iob, result.iob)
+        self.assertEqual(solver.resolve(result.tokens).iob, result.iob)
+        sentences = ["The girl said she would take the trash out", "Hello"]
+        self.assertEqual([r.resolved for r in solver.resolve_many(sentences)],
+                         [solver.replace_corefs(s) for s in sentences])
+
+    def test_process_stream(self):
+        from corefiob.cli import process_stream
+        records = [{"text": "Turn on the lights and make them blue"},
+                   {"text": "Here is the book now take it"}]
+        self.assertEqual([r for _, r in process_stream(records, chunksize=1)],
+                         ["Turn on the lights and make the lights blue",
+                          "Here is the book now take the book"])
+
+    def test_bad_records(self):
+        import io
+        from corefiob.cli import _read_records, process_stream
+        lines = ['{"text": "Here is the book now take it"}', '{"id": 1}', '[1, 2]', '{',
+                 '"Turn on the lights and make them blue"']
+        records = list(_read_records(io.StringIO("\n".join(lines)), "jsonl", "text"))
+        self.assertEqual([r.get("record") for r in records], [None, 2, 3, 4, None])
+        self.assertEqual(records[1]["error"], "missing text field 'text'")
+        self.assertEqual([r for _, r in process_stream(records, chunksize=2)],
+                         ["Here is the book now take the book", None, None, None,
+                          "Turn on the lights and make the lights blue"])
+
+    def test_failing_sentence(self):
+        from unittest import mock
+        from corefiob.cli import process_stream
+        iob_tag = HeuristicParser.iob_tag
+
+        def failing(self, postagged_toks):
+            if any(tok == "broken" for tok, _ in postagged_toks):
+                raise RuntimeError("tagger failed")
+            return iob_tag(self, postagged_toks)
+
+        records = [{"text": "Here is the book now take it"}, {"text": "a broken one"},
+                   {"text": "Turn on the lights and make them blue"}]
+        with mock.patch.object(HeuristicParser, "iob_tag", failing):
+            out = list(process_stream(records, tagger="lexicon"))
+        self.assertEqual([r for _, r in out],
+                         ["Here is the book now take the book", None,
+                          "Turn on the lights and make the lights blue"])
+        self.assertEqual([r.get("error") for r, _ in out],
+                         [None, "RuntimeError: tagger failed", None])
+
+
+class TestModelLoading(unittest.TestCase):
+    def test_lazy_load(self):
+        parser = HeuristicParser(slim=True)
+        self.assertEqual(parser.model, "en_core_web_sm")
+        self.assertIsNone(parser._tagger)
+        # pre-tagged input never touches spacy
+        self.assertEqual(parser.iob_tag([("Turn", "VERB"), ("on", "ADP"),
+                                         ("the", "DET"), ("lights", "NOUN"),
+                                         ("and", "CCONJ"), ("make", "VERB"),
+                                         ("them", "PRON"), ("blue", "ADJ")]),
+                         [('Turn', 'VERB', 'O'),
+                          ('on', 'ADP', 'O'),
+                          ('the', 'DET', 'B-ENTITY-INANIMATE'),
+                          ('lights', 'NOUN', 'I-ENTITY-INANIMATE'),
+                          ('and', 'CCONJ', 'O'),
+                          ('make', 'VERB', 'O'),
+                          ('them', 'PRON', 'B-COREF-INANIMATE'),
+                          ('blue', 'ADJ', 'O')])
+        self.assertIsNone(parser._tagger)
+
+
+class TestLexicon(unittest.TestCase):
+    def test_shared_index(self):
+        from corefiob import lexicon as lex
+        self.assertIs(HeuristicParser().lexicon, solver.lexicon)
+        self.assertEqual(solver.lexicon.get("them"),
+                         lex.INANIMATE_COREF | lex.NEUTRAL_COREF | lex.PLURAL_COREF)
+        self.assertEqual(solver.lexicon.get("girl"), lex.FEMALE)
+        self.assertEqual(solver.lexicon.get("unknown"), 0)
+
+
+class TestRuleParser(unittest.TestCase):
+    def test_same_as_heuristic(self):
+        from corefiob.metrics import ParserMetrics
+        from corefiob.rules import RuleParser
+        rule_solver = RuleParser()
+        # HeuristicParser runs the columnar passes too, with metrics it runs
+        # them one by one
+        tuple_solver = HeuristicParser(metrics=ParserMetrics())
+        sentences = [
+            "The girl said she would take the trash out",
+            "I have many friends. They are an important part of my life",
+            "George von Doomson is the best. His ideas are unique compared to Joe's",
+            "This is Conan the Barbarian of Hyperborea! He is a savage but he is noble",
+            "Here is the awesome machine now take it",
+            "Turn on the lights and make them blue",
+            "My neighbors have a cat. It has a bushy tail",
+            "The coin was too far away for the woman to reach it",
+            "Dog is man's best friend. It is always loyal",
+            "I voted for Bob because he is clear about his values. His ideas represent a majority of the nation. He is better than Alice",
+            "Leaders around the world say they stand for peace",
+            "A majority of the nation said they are in favor of democracy",
+            "My neighbours just adopted a puppy. They care for it like a baby",
+            "Members voted for John because they see him as a good leader"
+        ]
+        for sentence in sentences:
+            postagged = solver.pos_tag(sentence)
+            self.assertEqual(rule_solver.iob_tag(postagged), tuple_solver.iob_tag(postagged))
+            self.assertEqual(rule_solver.replace_corefs(sentence),
+                             tuple_solver.replace_corefs(sentence))
+
+    def test_columnar_tags(self):
+        from corefiob import CorefIOB
+        from corefiob import columnar as col
+        for tag in list(CorefIOB) + ["O", ""]:
+            self.assertIs(col.TAG_NAMES[col.encode_tag(tag)], tag)
+        self.assertEqual(col.to_inside(col.encode_tag(CorefIOB.ENTITY_MALE)),
+                         col.encode_tag(CorefIOB.ENTITY_MALE_I))
+        self.assertEqual(col.to_inside(col.O), col.O)
+
+    def test_batch(self):
+        from corefiob.vectorized import BatchParser
+        sentences = [solver.pos_tag(s) for s in [
+            "The girl said she would take the trash out",
+            "Here is the awesome machine now take it",
+            "My neighbours just adopted a puppy. They care for it like a baby",
+            "Members voted for John because they see him as a good leader"
+        ]] + [[]]
+        self.assertEqual(BatchParser().iob_tag_batch(sentences),
+                         [solver.iob_tag(s) for s in sentences])
+
+
+class TestCache(unittest.TestCase):
+    def test_lru(self):
+        from corefiob.cache import LRUCache
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)  # evicts b, a was used more recently
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats["hits"], 2)
+        self.assertEqual(cache.stats["misses"], 1)
+        self.assertEqual(cache.stats["evictions"], 1)
+
+    def test_ttl(self):
+        from corefiob.cache import LRUCache
+        cache = LRUCache(ttl=-1)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats["expirations"], 1)
+
+    def test_parser_cache(self):
+        from corefiob.cache import LRUCache
+        cache = LRUCache()
+        parser = HeuristicParser(cache=cache)
+        sentence = "Turn on the lights and make them blue"
+        iob = parser.iob_tag(sentence)
+        self.assertEqual(iob, solver.iob_tag(sentence))
+        # returned lists are copies, mutating them does not touch the cache
+        iob.clear()
+        self.assertEqual(parser.iob_tag(sentence), solver.iob_tag(sentence))
+        self.assertEqual(parser.replace_corefs(sentence),
+                         "Turn on the lights and make the lights blue")
+        self.assertEqual(parser.replace_corefs(sentence),
+                         "Turn on the lights and make the lights blue")
+        self.assertEqual(cache.stats["hits"], 3)
+
+    def test_signature_cache(self):
+        from corefiob.cache import SignatureCache
+        parser = HeuristicParser(memo=SignatureCache())
+        lamp = [("turn", "VERB"), ("on", "ADP"), ("the", "DET"), ("lamp", "NOUN"),
+                ("and", "CCONJ"), ("make", "VERB"), ("it", "PRON"), ("red", "ADJ")]
+        fan = [("turn", "VERB"), ("on", "ADP"), ("the", "DET"), ("fan", "NOUN"),
+               ("and", "CCONJ"), ("make", "VERB"), ("it", "PRON"), ("quiet", "ADJ")]
+        light = [("turn", "VERB"), ("on", "ADP"), ("the", "DET"), ("light", "NOUN"),
+                 ("and", "CCONJ"), ("make", "VERB"), ("it", "PRON"), ("red", "ADJ")]
+        self.assertEqual(parser.iob_tag(lamp), solver.iob_tag(lamp))
+        # same POS tags and lexicon classes, answered from the first sentence
+        self.assertEqual(parser.iob_tag(fan), solver.iob_tag(fan))
+        self.assertEqual(parser.memo.stats["hits"], 1)
+        # "light" is a known inanimate word, a different signature
+        self.assertEqual(parser.iob_tag(light), solver.iob_tag(light))
+        self.assertEqual(parser.memo.stats["hits"], 1)
+
+        # a second memo over the same store stands in for another worker or
+        # a restart, it sees the classes in another order
+        other = HeuristicParser(memo=SignatureCache(store=parser.memo.store))
+        shuffled = [("lamp", "NOUN"), ("on", "ADP"), ("the", "DET"), ("turn", "VERB"),
+                    ("and", "CCONJ"), ("lamp", "NOUN"), ("it", "PRON"), ("red", "ADJ")]
+        self.assertEqual(other.iob_tag(shuffled), solver.iob_tag(shuffled))
+        self.assertEqual(other.iob_tag(fan), solver.iob_tag(fan))
+        self.assertEqual(other.memo.stats["hits"], 2)
+
+    def test_sqlite_cache(self):
+        import os
+        import tempfile
+        from corefiob.cache import SQLiteCache
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            cache = SQLiteCache(path, max_entries=2)
+            cache.put(("iob", "a"), (("it", "PRON", "B-COREF-INANIMATE"),))
+            # a second handle stands in for another worker process
+            other = SQLiteCache(path, max_entries=2)
+            self.assertEqual(other.get(("iob", "a")), (("it", "PRON", "B-COREF-INANIMATE"),))
+            self.assertIsNone(other.get(("iob", "b")))
+            cache.put(("iob", "b"), "b")
+            cache.put(("iob", "c"), "c")
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get(("iob", "a")))
+            cache.close()
+            other.close()
+
+
+class TestTaggers(unittest.TestCase):
+    def test_lexicon_tagger(self):
+        parser = HeuristicParser(tagger="lexicon")
+        self.assertEqual(parser.pos_tag("Turn on the lights and make them blue"),
+                         [('Turn', 'VERB'), ('on', 'ADP'), ('the', 'DET'),
+                          ('lights', 'NOUN'), ('and', 'CCONJ'), ('make', 'VERB'),
+                          ('them', 'PRON'), ('blue', 'ADJ')])
+        self.assertEqual(parser.replace_corefs("Turn on the lights and make them blue"),
+                         "Turn on the lights and make the lights blue")
+
+    def test_pretokenized(self):
+        # token lists are tagged by the same spacy pipeline as raw text
+        sentence = "Turn on the lights and make them blue"
+        tokens = [token for token, _ in solver.pos_tag(sentence)]
+        self.assertEqual(solver.pos_tag(tokens), solver.pos_tag(sentence))
+        self.assertEqual(list(solver.pos_tag_many([tokens])), [solver.pos_tag(sentence)])
+
+    def test_unknown_tagger(self):
+        with self.assertRaises(ValueError):
+            HeuristicParser(tagger="nope").pos_tag("hello")
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_coalesced(self):
+        import asyncio
+        from corefiob.coalescer import RequestCoalescer
+        parser = HeuristicParser()
+        parser.coalescer = RequestCoalescer(parser, max_delay=0.01, max_batch=8)
+        sentences = ["The girl said she would take the trash out",
+                     "Turn on the lights and make them blue",
+                     "Here is the book now take it"]
+        resolved = await asyncio.gather(*[parser.replace_corefs_async(s) for s in sentences])
+        self.assertEqual(resolved, [solver.replace_corefs(s) for s in sentences])
+        iob = await parser.iob_tag_async(sentences[0])
+        self.assertEqual(iob, solver.iob_tag(sentences[0]))
+        # the three concurrent requests went out as one batch
+        self.assertEqual(parser.coalescer.stats["batches"], 2)
+
+    async def test_coalesced_errors(self):
+        import asyncio
+        from corefiob.coalescer import RequestCoalescer
+        parser = HeuristicParser(tagger="lexicon")
+        parser.coalescer = RequestCoalescer(parser, max_delay=0.01)
+        bad, good = await asyncio.gather(parser.replace_corefs_async(None),
+                                         parser.replace_corefs_async("make them blue"),
+                                         return_exceptions=True)
+        # a bad input in the same batch only fails its own caller
+        self.assertIsInstance(bad, Exception)
+        self.assertEqual(good, "make them blue")
+        self.assertEqual(parser.coalescer.stats["batches"], 1)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_metrics(self):
+        from corefiob.metrics import ParserMetrics
+        from corefiob.rules import RuleParser
+        postagged = [('Turn', 'VERB'), ('on', 'ADP'), ('the', 'DET'),
+                     ('lights', 'NOUN'), ('and', 'CCONJ'), ('make', 'VERB'),
+                     ('them', 'PRON'), ('blue', 'ADJ')]
+        metrics = ParserMetrics()
+        parser = HeuristicParser(metrics=metrics)
+        self.assertEqual(parser.iob_tag(postagged), solver.iob_tag(postagged))
+        stats = metrics.stats
+        # the passes iob_tag runs without metrics too
+        self.assertEqual(set(stats["stages"]),
+                         {"forward_pass", "corefs_after", "resolve_entities", "fixup_pass"})
+        self.assertEqual(stats["stages"]["forward_pass"]["calls"], 1)
+        self.assertEqual(stats["rules"], {"entities.inanimate": 1})
+
+        metrics.reset()
+        postagged = [("Bob", "PROPN"), ("said", "VERB"), ("he", "PRON"), ("likes", "VERB"),
+                     ("the", "DET"), ("dog", "NOUN"), (".", "PUNCT")]
+        self.assertEqual(RuleParser(metrics=metrics).iob_tag(postagged),
+                         solver.iob_tag(postagged))
+        self.assertEqual(metrics.stats["rules"],
+                         {"entities.neutral": 1, "entities.inanimate": 1,
+                          "disambiguate.no_coref_after": 2, "disambiguate.neutral_to_male": 1})
+
+
+class TestSpacyComponent(unittest.TestCase):
+    def test_component(self):
+        import spacy
+        import corefiob.spacy_component  # registers the "corefiob" factory
+        nlp = spacy.load(solver.model, exclude=["parser", "ner", "lemmatizer"])
+        nlp.add_pipe("corefiob")
+        sentence = "Turn on the lights and make them blue"
+        doc = nlp(sentence)
+        self.assertEqual([t._.coref_iob for t in doc],
+                         [tag for _, _, tag in solver.iob_tag(sentence)])
+        self.assertEqual(doc._.coref_clusters, [[[2, 3], [6]]])
+        self.assertEqual(doc._.coref_resolved, solver.replace_corefs(sentence))
+
+
+class TestSession(unittest.TestCase):
+    def test_session(self):
+        from corefiob.session import CorefSession
+        now = [0]
+        session = CorefSession(HeuristicParser(tagger="lexicon"), ttl=60,
+                               clock=lambda: now[0])
+        self.assertEqual(session.resolve("I switched on the kitchen light"),
+                         "I switched on the kitchen light")
+        now[0] = 2
+        # a turn without entities in between, turns are never tagged again
+        self.assertEqual(session.resolve("thanks"), "thanks")
+        now[0] = 5
+        self.assertEqual(session.resolve("please turn it off"),
+                         "please turn the kitchen light off")
+        self.assertEqual(session.antecedents["inanimate"], "the kitchen light")
+        # the light is forgotten ttl seconds after it was mentioned
+        now[0] = 100
+        self.assertEqual(session.resolve("please turn it off"), "please turn it off")
+        self.assertEqual(session.antecedents, {})
+
+        # the entity mentioned last wins, whichever turn it came from
+        session = CorefSession(HeuristicParser(tagger="lexicon"))
+        session.resolve("I greeted the teacher")
+        session.resolve("I have many friends")
+        self.assertEqual(session.resolve("they waved"), "many friends waved")
+        session.resolve("I greeted the teacher")
+        self.assertEqual(session.resolve("they waved"), "the teacher waved")
+
+
+class TestRegistry(unittest.TestCase):
+    def test_lru_budget(self):
+        from types import SimpleNamespace
+        from corefiob.registry import ModelRegistry
+        registry = ModelRegistry(max_bytes=250, sizer=lambda nlp: 100,
+                                 loader=lambda model, exclude: SimpleNamespace(lang=model[:2]))
+        en = registry.load("en_model")
+        self.assertIs(registry.load("en_model"), en)
+        registry.load("pt_model")
+        registry.load("en_model")
+        # over budget, pt_model is the least recently used
+        registry.load("es_model")
+        self.assertEqual(list(registry.stats), ["en_model", "es_model"])
+        self.assertEqual(registry.stats["en_model"]["hits"], 3)
+        self.assertEqual(registry.resident_bytes, 200)
+        self.assertEqual(registry.evictions, 1)
+
+    def test_concurrent_loads(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from types import SimpleNamespace
+        from corefiob.registry import ModelRegistry
+        release = threading.Event()
+        loads = []
+
+        def loader(model, exclude):
+            loads.append(model)
+            if model == "pt_model":
+                release.wait(5)
+            return SimpleNamespace(lang=model[:2])
+
+        registry = ModelRegistry(loader=loader)
+        en = registry.load("en_model")
+        with ThreadPoolExecutor(2) as pool:
+            pt = [pool.submit(registry.load, "pt_model") for _ in range(2)]
+            # a slow cold load does not hold up models already loaded
+            self.assertIs(registry.load("en_model"), en)
+            self.assertFalse(pt[0].done())
+            release.set()
+            self.assertIs(pt[0].result(), pt[1].result())
+        self.assertEqual(loads, ["en_model", "pt_model"])
+
+
+class TestGazetteer(unittest.TestCase):
+    def test_phrases(self):
+        from corefiob import lexicon as lex
+        from corefiob.gazetteer import TokenTrie
+        trie = TokenTrie()
+        for phrase in ["living room", "living room light", "smart tv"]:
+            trie.add(phrase, lex.INANIMATE)
+        # longest match, plural suffix and case are ignored like single words
+        self.assertEqual(trie.match(["the", "Living", "Room", "lights", "and", "smart", "tv"]),
+                         [(1, 4, lex.INANIMATE), (5, 7, lex.INANIMATE)])
+
+    def test_extend_lexicon(self):
+        from corefiob import lang
+        from corefiob.gazetteer import extend_lexicon
+        from corefiob.rules import RuleParser
+        inanimate = list(lang.INANIMATE_TOKENS["en"])
+
+        def restore():
+            lang.INANIMATE_TOKENS["en"][:] = inanimate
+            extend_lexicon("en", "INANIMATE_TOKENS", [])
+        self.addCleanup(restore)
+
+        extend_lexicon("en", "INANIMATE_TOKENS", ["living room light"])
+        postagged = [("Turn", "VERB"), ("on", "ADP"), ("the", "DET"), ("living", "VERB"),
+                     ("room", "NOUN"), ("light", "NOUN"), ("and", "CCONJ"),
+                     ("make", "VERB"), ("it", "PRON"), ("blue", "ADJ")]
+        for parser in [HeuristicParser(), RuleParser()]:
+            self.assertEqual(parser._render("Turn on the living room light and make it blue",
+                                            parser.iob_tag(postagged)),
+                             "Turn on the living room light and make the living room light blue")
+
+    def test_human_phrases(self):
+        from corefiob import lang
+        from corefiob.gazetteer import extend_lexicon
+        from corefiob.rules import RuleParser
+        human = list(lang.HUMAN_TOKENS["en"])
+
+        def restore():
+            lang.HUMAN_TOKENS["en"][:] = human
+            extend_lexicon("en", "HUMAN_TOKENS", [])
+        self.addCleanup(restore)
+
+        extend_lexicon("en", "HUMAN_TOKENS", ["living legend"])
+        postagged = [("I", "PRON"), ("saw", "VERB"), ("the", "DET"), ("living", "VERB"),
+                     ("legend", "NOUN"), ("and", "CCONJ"), ("they", "PRON"), ("waved", "VERB")]
+        for parser in [HeuristicParser(), RuleParser()]:
+            self.assertEqual(parser._render("I saw the living legend and they waved",
+                                            parser.iob_tag(postagged)),
+                             "I saw the living legend and the living legend waved")
+
+    def test_runtime_edit(self):
+        from corefiob import lang
+        from corefiob import lexicon as lex
+        male = list(lang.MALE_TOKENS["en"])
+
+        def restore():
+            lang.MALE_TOKENS["en"][:] = male
+            lex.clear_lexicons("en")
+        self.addCleanup(restore)
+
+        postagged = [("I", "PRON"), ("met", "VERB"), ("the", "DET"), ("king", "NOUN"),
+                     ("and", "CCONJ"), ("he", "PRON"), ("waved", "VERB")]
+        self.assertEqual(HeuristicParser().iob_tag(postagged)[3][2], "O")
+        lang.MALE_TOKENS["en"].append("king")
+        lex.clear_lexicons("en")
+        # parsers created afterwards see the edit, whatever engine they run
+        self.assertEqual([tag for _, _, tag in HeuristicParser().iob_tag(postagged)[2:4]],
+                         ["B-ENTITY-MALE", "I-ENTITY-MALE"])
+
+
+class TestServer(unittest.TestCase):
+    def test_endpoints(self):
+        import json
+        import threading
+        from urllib.error import HTTPError
+        from urllib.request import urlopen
+        from corefiob.server import CorefServer
+        server = CorefServer(HeuristicParser(tagger="lexicon"), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        url = "http://%s:%s" % server.address[:2]
+
+        def post(path, body):
+            with urlopen(url + path, json.dumps(body).encode("utf-8")) as r:
+                return json.loads(r.read())
+
+        self.assertEqual(post("/replace_corefs", {"text": "Turn on the lights and make them blue"}),
+                         {"replaced": "Turn on the lights and make the lights blue"})
+        self.assertEqual(post("/iob_tag", {"texts": ["the light", "turn it off"]}),
+                         {"iob": [[["the", "DET", "O"], ["light", "NOUN", "O"]],
+                                  [["turn", "VERB", "O"], ["it", "PRON", "B-COREF-INANIMATE"],
+                                   ["off", "ADP", "O"]]]})
+        with urlopen(url + "/health") as r:
+            self.assertEqual(json.loads(r.read())["status"], "ok")
+        with urlopen(url + "/stats") as r:
+            stats = json.loads(r.read())
+        self.assertEqual(stats["endpoints"]["iob_tag"]["requests"], 1)
+        self.assertEqual(stats["batching"]["requests"], 3)
+        for body in [{"texts": "abc"}, {"texts": [None]}, {"text": 1}, {}]:
+            with self.assertRaises(HTTPError) as e:
+                post("/iob_tag", body)
+            self.assertEqual(e.exception.code, 400)
+
+    def test_batch_errors(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from corefiob.server import _Batcher
+        batcher = _Batcher(HeuristicParser(tagger="lexicon"), max_delay=0.2)
+        batcher.start()
+        with ThreadPoolExecutor(2) as pool:
+            bad = pool.submit(batcher.submit_many, "replace_corefs", [None])
+            good = pool.submit(batcher.submit_many, "replace_corefs", ["make them blue"])
+            # a bad input in the same batch only fails its own request
+            self.assertRaises(Exception, bad.result)
+            self.assertEqual(good.result(), ["make them blue"])
+        self.assertEqual(batcher.batches, 1)
+
+
+class TestGate(unittest.TestCase):
+    def test_gate(self):
+        from corefiob.gate import PronounGate
+        gate = PronounGate("en")
+        self.assertFalse(gate.may_resolve("Turn on the lights"))
+        self.assertFalse(gate.may_resolve("the theme of the hermit"))
+        for text in ["make them blue", "It is loyal", "theyre here", "I like his, ok?"]:
+            self.assertTrue(gate.may_resolve(text), text)
+
+        parser = HeuristicParser(gate=PronounGate("en"))
+        self.assertEqual(parser.replace_corefs("Turn on the lights"), "Turn on the lights")
+        # tokenized like any other sentence, POS tagged from the word lists
+        gated = [("Turn", "VERB", "O"), ("on", "ADP", "O"), ("the", "DET", "O"),
+                 ("U.S.", "PROPN", "O"), ("lights", "NOUN", "O")]
+        self.assertEqual(parser.iob_tag("Turn on the U.S. lights"), gated)
+        self.assertEqual(parser.resolve("Turn on the U.S. lights").iob, gated)
+        self.assertEqual([result.iob for result in parser.resolve_many(["Turn on the U.S. lights"])],
+                         [gated])
+        self.assertEqual(list(parser.replace_corefs_many(
+            ["Turn on the lights", "Turn on the lights and make them blue", "Hello"])),
+            ["Turn on the lights", "Turn on the lights and make the lights blue", "Hello"])
+        self.assertEqual(parser.gate.stats["checked"], 7)
+        self.assertEqual(parser.gate.stats["fired"], 6)